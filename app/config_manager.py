@@ -3,11 +3,139 @@ Configuration Manager for Heisha Weather Prediction Control
 Handles loading and validation of configuration from Home Assistant
 """
 
-import json
 import os
+import asyncio
 import logging
+from dataclasses import dataclass, fields
+from types import MappingProxyType
 from typing import Dict, Any, Optional
 
+from compat import loads
+
+# Section defaults applied by ConfigManager._validate_and_set_defaults
+_MQTT_DEFAULTS = MappingProxyType({
+    'broker': 'core-mosquitto',
+    'port': 1883,
+    'username': '',
+    'password': '',
+    'topic_prefix': 'panasonic_heat_pump'
+})
+
+_WEATHER_DEFAULTS = MappingProxyType({
+    'api_provider': 'openweathermap',
+    'api_key': '',
+    'update_interval': 300
+})
+
+_HOUSE_DEFAULTS = MappingProxyType({
+    'latitude': 51.1657,
+    'longitude': 10.4515,
+    'timezone': 'Europe/Berlin',
+    'heating_system_type': 'underfloor',
+    'building_thermal_mass': 'medium',
+    'target_temperature': 21.0,
+    'night_setback': 2.0
+})
+
+_ADVANCED_DEFAULTS = MappingProxyType({
+    'thermal_lag_hours': 4.0,
+    'solar_gain_factor': 0.3,
+    'wind_factor': 0.1,
+    'learning_rate': 0.05,
+    'prediction_horizon_hours': 24,
+    'min_runtime_minutes': 30,
+    'max_modulation': 100,
+    'online_learning': False
+})
+
+# (section, key, min, max, fatal, message) - fatal violations raise ValueError,
+# the others are only logged as warnings
+_RANGE_CHECKS = (
+    ('house', 'latitude', -90, 90, True,
+     "Invalid latitude: %s. Must be between -90 and 90"),
+    ('house', 'longitude', -180, 180, True,
+     "Invalid longitude: %s. Must be between -180 and 180"),
+    ('house', 'target_temperature', 15, 30, True,
+     "Invalid target temperature: %s. Must be between 15 and 30°C"),
+    ('advanced', 'thermal_lag_hours', 0.5, 12, False,
+     "thermal_lag_hours %s outside recommended range 0.5-12"),
+    ('advanced', 'solar_gain_factor', 0, 1, True,
+     "solar_gain_factor must be between 0 and 1, got %s"),
+    ('advanced', 'wind_factor', 0, 1, True,
+     "wind_factor must be between 0 and 1, got %s"),
+    ('advanced', 'learning_rate', 0.001, 0.5, False,
+     "learning_rate %s outside recommended range 0.001-0.5"),
+)
+
+
+def _from_section(cls, section: Dict[str, Any]):
+    """Build a config dataclass from a validated config section"""
+    return cls(**{f.name: section[f.name] for f in fields(cls)})
+
+
+@dataclass(frozen=True, slots=True)
+class MqttConfig:
+    """MQTT broker settings"""
+    broker: str
+    port: int
+    username: Optional[str]
+    password: Optional[str]
+    topic_prefix: str
+
+
+@dataclass(frozen=True, slots=True)
+class WeatherConfig:
+    """Weather API settings"""
+    api_provider: str
+    api_key: str
+    update_interval: int
+
+
+@dataclass(frozen=True, slots=True)
+class HouseConfig:
+    """Building and location settings"""
+    latitude: float
+    longitude: float
+    timezone: str
+    heating_system_type: str
+    building_thermal_mass: str
+    target_temperature: float
+    night_setback: float
+
+
+@dataclass(frozen=True, slots=True)
+class AdvancedConfig:
+    """Expert settings for the predictive algorithm"""
+    thermal_lag_hours: float
+    solar_gain_factor: float
+    wind_factor: float
+    learning_rate: float
+    prediction_horizon_hours: int
+    min_runtime_minutes: int
+    max_modulation: int
+    online_learning: bool
+
+
+@dataclass(frozen=True, slots=True)
+class AppConfig:
+    """Typed, read-only view of the validated configuration"""
+    mqtt: MqttConfig
+    weather: WeatherConfig
+    house: HouseConfig
+    advanced: AdvancedConfig
+    log_level: str
+    
+    @classmethod
+    def from_dict(cls, config: Dict[str, Any]) -> 'AppConfig':
+        """Create from a configuration dict returned by ConfigManager.load_config"""
+        return cls(
+            mqtt=_from_section(MqttConfig, config['mqtt']),
+            weather=_from_section(WeatherConfig, config['weather']),
+            house=_from_section(HouseConfig, config['house']),
+            advanced=_from_section(AdvancedConfig, config['advanced']),
+            log_level=config['logging']['level']
+        )
+
 class ConfigManager:
     """Manages configuration loading and validation"""
     
@@ -15,13 +143,34 @@ class ConfigManager:
         self.logger = logging.getLogger(__name__)
         self.config_file = os.getenv('CONFIG_FILE', '/data/options.json')
         
+        # Last validated configuration and the options file mtime it was read at
+        self._cached_config = None
+        self._cached_mtime = None
+        
     def load_config(self) -> Dict[str, Any]:
         """Load configuration from Home Assistant options"""
+        return self._sync_load_config()
+    
+    async def load_config_async(self) -> Dict[str, Any]:
+        """Load configuration without blocking the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._sync_load_config)
+    
+    def _sync_load_config(self) -> Dict[str, Any]:
+        """Read, validate and cache the configuration (blocking file I/O)"""
         try:
+            try:
+                mtime = os.stat(self.config_file).st_mtime
+            except FileNotFoundError:
+                mtime = None
+            
+            # Options file unchanged (or still absent) since the last load
+            if self._cached_config is not None and mtime == self._cached_mtime:
+                return self._cached_config
+            
             # First try to load from file
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
+            if mtime is not None:
+                with open(self.config_file, 'rb') as f:
+                    config = loads(f.read())
                 self.logger.info(f"Configuration loaded from {self.config_file}")
             else:
                 # Fallback to environment variables
@@ -31,6 +180,9 @@ class ConfigManager:
             # Validate and set defaults
             config = self._validate_and_set_defaults(config)
             
+            self._cached_config = config
+            self._cached_mtime = mtime
+            
             return config
             
         except Exception as e:
@@ -39,27 +191,29 @@ class ConfigManager:
     
     def _load_from_env(self) -> Dict[str, Any]:
         """Load configuration from environment variables as fallback"""
+        env = os.environ
+        
         return {
             'mqtt': {
-                'broker': os.getenv('MQTT_BROKER', 'core-mosquitto'),
-                'port': int(os.getenv('MQTT_PORT', '1883')),
-                'username': os.getenv('MQTT_USERNAME', ''),
-                'password': os.getenv('MQTT_PASSWORD', ''),
-                'topic_prefix': os.getenv('TOPIC_PREFIX', 'panasonic_heat_pump')
+                'broker': env.get('MQTT_BROKER', 'core-mosquitto'),
+                'port': int(env.get('MQTT_PORT', '1883')),
+                'username': env.get('MQTT_USERNAME', ''),
+                'password': env.get('MQTT_PASSWORD', ''),
+                'topic_prefix': env.get('TOPIC_PREFIX', 'panasonic_heat_pump')
             },
             'weather': {
-                'api_provider': os.getenv('WEATHER_PROVIDER', 'openweathermap'),
-                'api_key': os.getenv('WEATHER_API_KEY', ''),
-                'update_interval': int(os.getenv('WEATHER_UPDATE_INTERVAL', '300'))
+                'api_provider': env.get('WEATHER_PROVIDER', 'openweathermap'),
+                'api_key': env.get('WEATHER_API_KEY', ''),
+                'update_interval': int(env.get('WEATHER_UPDATE_INTERVAL', '300'))
             },
             'house': {
-                'latitude': float(os.getenv('LATITUDE', '51.1657')),
-                'longitude': float(os.getenv('LONGITUDE', '10.4515')),
-                'timezone': os.getenv('TIMEZONE', 'Europe/Berlin'),
-                'heating_system_type': os.getenv('HEATING_SYSTEM_TYPE', 'underfloor'),
-                'building_thermal_mass': os.getenv('BUILDING_THERMAL_MASS', 'medium'),
-                'target_temperature': float(os.getenv('TARGET_TEMPERATURE', '21.0')),
-                'night_setback': float(os.getenv('NIGHT_SETBACK', '2.0'))
+                'latitude': float(env.get('LATITUDE', '51.1657')),
+                'longitude': float(env.get('LONGITUDE', '10.4515')),
+                'timezone': env.get('TIMEZONE', 'Europe/Berlin'),
+                'heating_system_type': env.get('HEATING_SYSTEM_TYPE', 'underfloor'),
+                'building_thermal_mass': env.get('BUILDING_THERMAL_MASS', 'medium'),
+                'target_temperature': float(env.get('TARGET_TEMPERATURE', '21.0')),
+                'night_setback': float(env.get('NIGHT_SETBACK', '2.0'))
             },
             'advanced': {
                 'thermal_lag_hours': 4.0,
@@ -68,10 +222,11 @@ class ConfigManager:
                 'learning_rate': 0.05,
                 'prediction_horizon_hours': 24,
                 'min_runtime_minutes': 30,
-                'max_modulation': 100
+                'max_modulation': 100,
+                'online_learning': False
             },
             'logging': {
-                'level': os.getenv('LOG_LEVEL', 'INFO')
+                'level': env.get('LOG_LEVEL', 'INFO')
             }
         }
     
@@ -79,80 +234,22 @@ class ConfigManager:
         """Validate configuration and set defaults"""
         
         # MQTT validation
-        if 'mqtt' not in config:
-            config['mqtt'] = {}
-        
-        mqtt_defaults = {
-            'broker': 'core-mosquitto',
-            'port': 1883,
-            'username': '',
-            'password': '',
-            'topic_prefix': 'panasonic_heat_pump'
-        }
-        
-        for key, default in mqtt_defaults.items():
-            if key not in config['mqtt']:
-                config['mqtt'][key] = default
+        config['mqtt'] = {**_MQTT_DEFAULTS, **config.get('mqtt', {})}
         
         # Weather validation
-        if 'weather' not in config:
-            config['weather'] = {}
-        
-        weather_defaults = {
-            'api_provider': 'openweathermap',
-            'api_key': '',
-            'update_interval': 300
-        }
-        
-        for key, default in weather_defaults.items():
-            if key not in config['weather']:
-                config['weather'][key] = default
+        config['weather'] = {**_WEATHER_DEFAULTS, **config.get('weather', {})}
         
         if not config['weather']['api_key']:
             self.logger.warning("No weather API key provided - weather features will be limited")
         
         # House configuration validation
-        if 'house' not in config:
-            config['house'] = {}
-        
-        house_defaults = {
-            'latitude': 51.1657,
-            'longitude': 10.4515,
-            'timezone': 'Europe/Berlin',
-            'heating_system_type': 'underfloor',
-            'building_thermal_mass': 'medium',
-            'target_temperature': 21.0,
-            'night_setback': 2.0
-        }
-        
-        for key, default in house_defaults.items():
-            if key not in config['house']:
-                config['house'][key] = default
+        config['house'] = {**_HOUSE_DEFAULTS, **config.get('house', {})}
         
         # Advanced configuration validation
-        if 'advanced' not in config:
-            config['advanced'] = {}
-        
-        advanced_defaults = {
-            'thermal_lag_hours': 4.0,
-            'solar_gain_factor': 0.3,
-            'wind_factor': 0.1,
-            'learning_rate': 0.05,
-            'prediction_horizon_hours': 24,
-            'min_runtime_minutes': 30,
-            'max_modulation': 100
-        }
-        
-        for key, default in advanced_defaults.items():
-            if key not in config['advanced']:
-                config['advanced'][key] = default
+        config['advanced'] = {**_ADVANCED_DEFAULTS, **config.get('advanced', {})}
         
         # Logging validation
-        if 'logging' not in config:
-            config['logging'] = {}
-        
-        if 'level' not in config['logging']:
-            config['logging']['level'] = 'INFO'
+        config['logging'] = {'level': 'INFO', **config.get('logging', {})}
         
         # Validate ranges
         self._validate_ranges(config)
@@ -161,35 +258,11 @@ class ConfigManager:
     
     def _validate_ranges(self, config: Dict[str, Any]):
         """Validate configuration value ranges"""
+        for section, key, low, high, fatal, message in _RANGE_CHECKS:
+            value = config[section][key]
+            if not (low <= value <= high):
+                if fatal:
+                    raise ValueError(message % value)
+                self.logger.warning(message, value)
         
-        # Coordinate validation
-        lat = config['house']['latitude']
-        lon = config['house']['longitude']
-        
-        if not (-90 <= lat <= 90):
-            raise ValueError(f"Invalid latitude: {lat}. Must be between -90 and 90")
-        
-        if not (-180 <= lon <= 180):
-            raise ValueError(f"Invalid longitude: {lon}. Must be between -180 and 180")
-        
-        # Temperature validation
-        target_temp = config['house']['target_temperature']
-        if not (15 <= target_temp <= 30):
-            raise ValueError(f"Invalid target temperature: {target_temp}. Must be between 15 and 30°C")
-        
-        # Advanced parameter validation
-        adv = config['advanced']
-        
-        if not (0.5 <= adv['thermal_lag_hours'] <= 12):
-            self.logger.warning(f"thermal_lag_hours {adv['thermal_lag_hours']} outside recommended range 0.5-12")
-        
-        if not (0 <= adv['solar_gain_factor'] <= 1):
-            raise ValueError(f"solar_gain_factor must be between 0 and 1, got {adv['solar_gain_factor']}")
-        
-        if not (0 <= adv['wind_factor'] <= 1):
-            raise ValueError(f"wind_factor must be between 0 and 1, got {adv['wind_factor']}")
-        
-        if not (0.001 <= adv['learning_rate'] <= 0.5):
-            self.logger.warning(f"learning_rate {adv['learning_rate']} outside recommended range 0.001-0.5")
-        
-        self.logger.info("Configuration validation completed successfully")
\ No newline at end of file
+        self.logger.info("Configuration validation completed successfully")
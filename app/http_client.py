@@ -0,0 +1,77 @@
+"""
+HTTP client for Heisha Weather Prediction Control
+Shared aiohttp session for all long-lived services of the add-on
+"""
+
+import asyncio
+import logging
+import socket
+from typing import Dict, Any, List, Optional
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+class _FallbackResolver(AbstractResolver):
+    """DNS resolver that answers with the last good addresses when a lookup fails
+    
+    Keeps requests working through the DNS hiccups common on small home
+    servers, the API hosts rarely change their addresses.
+    """
+    
+    def __init__(self, resolver: Optional[AbstractResolver] = None):
+        self.logger = logging.getLogger(__name__)
+        self._resolver = resolver or aiohttp.DefaultResolver()
+        self._last_good = {}
+    
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict[str, Any]]:
+        key = (host, port, family)
+        try:
+            addresses = await self._resolver.resolve(host, port, family)
+        except OSError as e:
+            if key not in self._last_good:
+                raise
+            self.logger.warning(f"DNS lookup for {host} failed ({e}) - using the last known addresses")
+            return self._last_good[key]
+        
+        self._last_good[key] = addresses
+        return addresses
+    
+    async def close(self):
+        await self._resolver.close()
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """HTTP session with a small keep-alive pool sized for the weather requests
+    
+    At most two requests (current weather and forecast) run at once, against
+    a single host whose address is cached for an hour.
+    """
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=4, limit_per_host=4, use_dns_cache=True, ttl_dns_cache=3600,
+                                       resolver=_FallbackResolver(),
+                                       keepalive_timeout=300, enable_cleanup_closed=True)
+    )
+
+
+# Application-wide session, bound to the loop it was created on
+_shared_session: Optional[aiohttp.ClientSession] = None
+_shared_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_shared_session() -> aiohttp.ClientSession:
+    """Shared HTTP session of the running event loop, created on first use"""
+    global _shared_session, _shared_loop
+    
+    loop = asyncio.get_running_loop()
+    if _shared_session is None or _shared_session.closed or _shared_loop is not loop:
+        _shared_session = create_http_session()
+        _shared_loop = loop
+    return _shared_session
+
+
+async def close_shared_session():
+    """Close the shared HTTP session, the next get_shared_session creates a new one"""
+    global _shared_session, _shared_loop
+    
+    session, _shared_session, _shared_loop = _shared_session, None, None
+    if session is not None and not session.closed:
+        await session.close()
@@ -4,12 +4,84 @@ Advanced predictive control algorithms with weather forecasting and learning
 """
 
 import logging
+import math
 import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
 
-from weather_service import WeatherService
+from weather_service import Forecast, WeatherService
 from learning_engine import LearningEngine
+from compat import dumps, njit
+
+# Control decisions kept for recurring, quantized inputs
+PREDICTION_CACHE_SIZE = 32
+
+
+@dataclass(slots=True)
+class HourlyPrediction:
+    """Predicted conditions for a single forecast hour"""
+    hour_offset: int
+    forecast_time: datetime
+    outside_temp: float
+    comfort_target: float
+    solar_gain: float
+    wind_loss: float
+    humidity_factor: float
+    total_impact: float
+    heat_demand: float
+    predicted_room_temp: float
+    predicted_energy: float
+    predicted_cop: float
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to the per-hour record layout"""
+        record = asdict(self)
+        record['weather_impact'] = {
+            'solar_gain': self.solar_gain,
+            'wind_loss': self.wind_loss,
+            'humidity_factor': record.pop('humidity_factor'),
+            'total_impact': record.pop('total_impact')
+        }
+        return record
+    
+    def to_json(self) -> str:
+        """Serialize the per-hour record, formatting the forecast time"""
+        return dumps(self.to_dict())
+
+
+@njit(cache=True, fastmath=True, boundscheck=False)
+def _weighted_mean(values: np.ndarray, weights: np.ndarray) -> float:
+    """Weighted mean of two equally sized float64 arrays"""
+    total = 0.0
+    weight_sum = 0.0
+    for i in range(values.shape[0]):
+        total += values[i] * weights[i]
+        weight_sum += weights[i]
+    return total / weight_sum
+
+
+@njit(cache=True, fastmath=True)
+def _hourly_kernel(outside: np.ndarray, wind: np.ndarray, clouds: np.ndarray,
+                   humidity: np.ndarray, hour_of_day: np.ndarray, solar_lut: np.ndarray,
+                   solar_gain_factor: float, wind_factor: float, day_target: float,
+                   night_target: float, demand_factor: float):
+    """Comfort target, weather impact and heat demand for each forecast hour"""
+    is_day = (hour_of_day >= 6) & (hour_of_day < 22)
+    comfort = np.where(is_day, day_target, night_target)
+    
+    # Solar table lookup by hour and nearest 10% cloud cover bin
+    cloud_bins = np.minimum(np.maximum(np.rint(clouds / 10), 0), 10).astype(np.int64)
+    solar_gain = solar_lut.ravel()[hour_of_day * solar_lut.shape[1] + cloud_bins] * solar_gain_factor
+    
+    wind_loss = wind * wind_factor * np.maximum(0.0, 20 - outside) / 20
+    humidity_factor = 1.0 + (humidity - 50) / 500
+    total_impact = solar_gain - wind_loss
+    heat_demand = (np.maximum(0.0, (comfort - outside) * 0.5) - total_impact) * demand_factor
+    
+    return comfort, solar_gain, wind_loss, humidity_factor, total_impact, heat_demand
 
 
 class PredictiveAlgorithm:
@@ -32,22 +104,53 @@ class PredictiveAlgorithm:
         self.building_mass = config['house']['building_thermal_mass']
         self.heating_system = config['house']['heating_system_type']
         
+        # Heat demand factors for building thermal mass and heating system efficiency
+        self._mass_factor = {'low': 1.2, 'medium': 1.0, 'high': 0.8}.get(self.building_mass, 1.0)
+        self._system_factor = {'radiator': 1.1, 'underfloor': 0.9, 'mixed': 1.0}.get(self.heating_system, 1.0)
+        self._combined_factor = self._mass_factor * self._system_factor
+        
+        # Room response coefficient, recomputed only when the thermal lag changes
+        self._response_lag = None
+        self._response_coeff = 0.0
+        
         # Control state
         self.last_prediction = None
-        self.control_history = []
+        self._prediction_cache = OrderedDict()
+        
+        # Ring buffer of the most recent control decisions, one array per column
+        self._history_capacity = 24 * 7
+        self._history_idx = 0
+        self.control_history = {
+            'timestamp': np.zeros(self._history_capacity, dtype=np.int64),
+            'room_temp': np.zeros(self._history_capacity, dtype=np.float32),
+            'outside_temp': np.zeros(self._history_capacity, dtype=np.float32),
+            'target': np.zeros(self._history_capacity, dtype=np.float32),
+            'action_needed': np.zeros(self._history_capacity, dtype=np.bool_)
+        }
         
         # Comfort zones
         self.comfort_zones = {
             'day': {'start': 6, 'end': 22, 'temp': self.target_temperature},
             'night': {'start': 22, 'end': 6, 'temp': self.target_temperature - self.night_setback}
         }
+        
+        # Solar gain (max 2°C equivalent) by hour of day and 10% cloud cover bin,
+        # before solar_gain_factor
+        hours = np.arange(24)
+        solar_elevation = np.where((hours >= 6) & (hours <= 18), np.sin(np.pi * (hours - 6) / 12), 0.0)
+        cloud_reduction = 1.0 - np.arange(11) * 10 / 100 * 0.8
+        self._solar_lut = 2.0 * solar_elevation[:, None] * cloud_reduction[None, :]
+        
+        # Decreasing weight with time for the next 12 hours
+        self._optimal_target_weights = 1.0 / np.arange(1, 13, dtype=np.float64)
     
     async def predict(self, current_status: Dict[str, Any], 
-                     weather_forecast: List[Dict[str, Any]]) -> Dict[str, Any]:
+                     weather_forecast: Union[Forecast, List[Dict[str, Any]]]) -> Dict[str, Any]:
         """Main prediction and control decision algorithm"""
         
+        now = datetime.now()
         prediction_result = {
-            'timestamp': datetime.now(),
+            'timestamp': now,
             'action_needed': False,
             'settings': {},
             'predictions': [],
@@ -57,35 +160,57 @@ class PredictiveAlgorithm:
         
         try:
             # Get current conditions
-            current_temp = current_status.get('temperatures', {}).get('room', 20.0)
-            current_target = current_status.get('temperatures', {}).get('target', 21.0)
-            outside_temp = current_status.get('temperatures', {}).get('outside', 10.0)
+            temps = current_status.get('temperatures') or {}
+            current_temp = temps.get('room', 20.0)
+            current_target = temps.get('target', 21.0)
+            outside_temp = temps.get('outside', 10.0)
+            outlet_temp = temps.get('outlet', 30.0)
             
-            # Calculate comfort target for each hour ahead
-            hourly_predictions = []
+            # Thermal lag and confidence only depend on learning data, resolve them once
+            thermal_lag = self.learning_engine.calculate_thermal_lag(self.building_mass, self.heating_system)
+            confidence = self.learning_engine.get_learning_confidence()
+            
+            horizon = min(self.prediction_horizon, len(weather_forecast))
+            cache_key = self._prediction_cache_key(
+                temps, weather_forecast[:horizon], now, thermal_lag, confidence
+            )
+            cached = self._prediction_cache.get(cache_key)
             
-            for hour in range(min(self.prediction_horizon, len(weather_forecast))):
-                forecast_time = datetime.now() + timedelta(hours=hour)
-                weather_data = weather_forecast[hour] if hour < len(weather_forecast) else weather_forecast[-1]
+            if cached is not None:
+                self._prediction_cache.move_to_end(cache_key)
+                hourly_predictions, control_decision = cached
+                self.logger.debug("Reusing cached prediction for unchanged inputs")
+            else:
+                # Predict all forecast hours in one vectorized pass
+                hourly_predictions = self._predict_hourly_batch(
+                    weather_forecast, current_temp, outlet_temp, horizon, now, thermal_lag, confidence
+                )
                 
-                # Predict conditions for this hour
-                hour_prediction = await self._predict_hourly_conditions(
-                    forecast_time, weather_data, current_status, hour
+                # Determine control actions
+                control_decision = self._calculate_control_actions(
+                    current_temp, hourly_predictions, thermal_lag, confidence
                 )
                 
-                hourly_predictions.append(hour_prediction)
+                self._prediction_cache[cache_key] = (hourly_predictions, control_decision)
+                if len(self._prediction_cache) > PREDICTION_CACHE_SIZE:
+                    self._prediction_cache.popitem(last=False)
             
             prediction_result['predictions'] = hourly_predictions
-            
-            # Determine control actions
-            control_decision = await self._calculate_control_actions(
-                current_status, hourly_predictions
+            prediction_result.update(
+                control_decision,
+                settings=dict(control_decision['settings']),
+                reasoning=list(control_decision['reasoning'])
             )
             
-            prediction_result.update(control_decision)
+            self._record_history(
+                now, current_temp, outside_temp,
+                control_decision['settings'].get('target_temperature', current_target),
+                control_decision['action_needed']
+            )
             
             # Update learning and adaptation
-            await self._update_adaptive_parameters()
+            if cached is None:
+                self._update_adaptive_parameters()
             
             # Store prediction for comparison
             self.last_prediction = prediction_result
@@ -98,12 +223,160 @@ class PredictiveAlgorithm:
         
         return prediction_result
     
-    async def _predict_hourly_conditions(self, forecast_time: datetime, 
-                                       weather_data: Dict[str, Any],
-                                       current_status: Dict[str, Any],
-                                       hour_offset: int) -> Dict[str, Any]:
+    def _prediction_cache_key(self, temps: Dict[str, Any], forecast: Union[Forecast, List[Dict[str, Any]]],
+                              now: datetime, thermal_lag: float, confidence: float) -> tuple:
+        """Build the cache key from quantized inputs and the learning state"""
+        fields = ('temperature', 'wind_speed', 'clouds', 'humidity')
+        if isinstance(forecast, Forecast):
+            weather = tuple(forecast.column(key).tobytes() for key in fields)
+        else:
+            weather = tuple(tuple(entry.get(key) for key in fields) for entry in forecast)
+        
+        return (
+            tuple(round(temps.get(key) or 0.0, 1) for key in ('room', 'target', 'outside', 'outlet')),
+            weather,
+            now.hour,
+            now.weekday(),
+            thermal_lag,
+            confidence,
+            self.solar_gain_factor,
+            self.wind_factor,
+            self.learning_engine.historical_data.generation,
+            self.learning_engine.model_version
+        )
+    
+    def _vectorize_forecast(self, weather_forecast: Union[Forecast, List[Dict[str, Any]]], 
+                            horizon: int) -> Dict[str, np.ndarray]:
+        """Flatten the first forecast hours into one float64 array per field"""
+        forecast = weather_forecast[:horizon]
+        fields = (('temperature', 10), ('wind_speed', 0), ('clouds', 0), ('humidity', 50))
+        
+        if isinstance(forecast, Forecast):
+            return {
+                key: np.where(np.isnan(forecast.column(key)), default, forecast.column(key))
+                for key, default in fields
+            }
+        
+        return {
+            key: np.fromiter((entry.get(key, default) for entry in forecast),
+                             dtype=np.float64, count=horizon)
+            for key, default in fields
+        }
+    
+    def _predict_hourly_batch(self, weather_forecast: Union[Forecast, List[Dict[str, Any]]],
+                              room_temp: float, outlet_temp: float,
+                              horizon: int, now: datetime,
+                              thermal_lag: float, confidence: float) -> Dict[str, np.ndarray]:
+        """Predict conditions for all forecast hours at once, one array per field"""
+        
+        if horizon <= 0:
+            return {name: np.empty(0) for name in HourlyPrediction.__slots__ if name != 'forecast_time'}
+        
+        now_hour, now_weekday, now_month = now.hour, now.weekday(), now.month
+        weather = self._vectorize_forecast(weather_forecast, horizon)
+        outside = weather['temperature']
+        wind = weather['wind_speed']
+        clouds = weather['clouds']
+        humidity = weather['humidity']
+        
+        hours = np.arange(horizon, dtype=np.int64)
+        forecast_hours = (now_hour + hours) % 24
+        
+        # Comfort target, weather impact and heat demand adjusted for
+        # building mass and heating system
+        comfort, solar_gain, wind_loss, humidity_factor, total_impact, heat_demand = _hourly_kernel(
+            outside, wind, clouds, humidity, forecast_hours, self._solar_lut,
+            float(self.solar_gain_factor), float(self.wind_factor),
+            float(self.target_temperature), float(self.target_temperature - self.night_setback),
+            self._combined_factor
+        )
+        
+        # System response
+        temp_diff = outlet_temp - outside
+        with np.errstate(divide='ignore', invalid='ignore'):
+            carnot_cop = np.clip((outlet_temp + 273.15) / temp_diff * 0.45, 2.0, 6.0)
+        expected_cop = np.where(temp_diff <= 0, 6.0, carnot_cop)
+        
+        # Blend with the learning engine where it has a trained model
+        building_mass = self.learning_engine._encode_building_mass(self.building_mass)
+        
+        # One model call per horizon, columns in the training feature order
+        constant = np.ones(horizon)
+        shared = (now_weekday * constant, now_month * constant, building_mass * constant)
+        demand_features = np.column_stack((
+            outside, humidity, wind, clouds, 20.0 * constant, comfort, forecast_hours, *shared
+        ))
+        cop_features = np.column_stack((
+            outside, humidity, wind, clouds, room_temp * constant, (room_temp + 1) * constant,
+            now_hour * constant, *shared
+        ))
+        learned_demand = self.learning_engine.predict_energy_consumption_batch(demand_features)
+        learned_cop = self.learning_engine.predict_cop_batch(cop_features)
+        
+        if learned_demand is not None:
+            heat_demand = heat_demand * (1 - confidence) + learned_demand * confidence
+        heat_demand = np.maximum(0.0, heat_demand)
+        predicted_cop = expected_cop
+        if learned_cop is not None:
+            predicted_cop = expected_cop * (1 - confidence) + learned_cop * confidence
+        predicted_cop = np.clip(predicted_cop, 1.0, 6.0)
+        
+        predicted_room_temp = room_temp + heat_demand * 0.5 * self._thermal_response_coeff(thermal_lag)
+        predicted_energy = heat_demand * 1.2
+        
+        return {
+            'hour_offset': hours,
+            'outside_temp': outside,
+            'comfort_target': comfort,
+            'solar_gain': solar_gain,
+            'wind_loss': wind_loss,
+            'humidity_factor': humidity_factor,
+            'total_impact': total_impact,
+            'heat_demand': heat_demand,
+            'predicted_room_temp': predicted_room_temp,
+            'predicted_energy': predicted_energy,
+            'predicted_cop': predicted_cop
+        }
+    
+    def get_hourly_predictions(self) -> List[HourlyPrediction]:
+        """Get the per-hour records of the last prediction"""
+        if not self.last_prediction:
+            return []
+        
+        predictions = self.last_prediction['predictions']
+        start = self.last_prediction['timestamp']
+        columns = [predictions[name].tolist() for name in HourlyPrediction.__slots__
+                   if name != 'forecast_time']
+        
+        return [
+            HourlyPrediction(hour, start + timedelta(hours=hour), *values)
+            for hour, *values in zip(*columns)
+        ]
+    
+    def get_predictions_frame(self) -> pd.DataFrame:
+        """Get the last prediction as a DataFrame indexed by forecast time"""
+        if not self.last_prediction:
+            return pd.DataFrame()
+        
+        predictions = self.last_prediction['predictions']
+        start = pd.Timestamp(self.last_prediction['timestamp'])
+        index = start + pd.to_timedelta(predictions['hour_offset'], unit='h')
+        
+        return pd.DataFrame(predictions, index=pd.DatetimeIndex(index, name='forecast_time'))
+    
+    def _predict_hourly_conditions(self, forecast_time: datetime, 
+                                   weather_data: Dict[str, Any],
+                                   current_status: Dict[str, Any],
+                                   hour_offset: int,
+                                   now: Optional[datetime] = None,
+                                   confidence: Optional[float] = None) -> Dict[str, Any]:
         """Predict conditions for a specific hour"""
         
+        if now is None:
+            now = datetime.now()
+        if confidence is None:
+            confidence = self.learning_engine.get_learning_confidence()
+        
         # Calculate comfort target for this time
         comfort_target = self._calculate_comfort_target(forecast_time)
         
@@ -111,18 +384,18 @@ class PredictiveAlgorithm:
         weather_impact = self._calculate_weather_impact(weather_data, forecast_time)
         
         # Predict heat demand
-        heat_demand = await self._predict_heat_demand(
-            comfort_target, weather_data, current_status, hour_offset
+        heat_demand = self._predict_heat_demand(
+            comfort_target, weather_data, current_status, hour_offset, now, confidence
         )
         
         # Predict system response
-        system_response = await self._predict_system_response(
-            heat_demand, weather_data, current_status
+        system_response = self._predict_system_response(
+            heat_demand, weather_data, current_status, now, confidence
         )
         
         return {
             'hour_offset': hour_offset,
-            'forecast_time': forecast_time.isoformat(),
+            'forecast_time': forecast_time,
             'outside_temp': weather_data.get('temperature', 0),
             'comfort_target': comfort_target,
             'weather_impact': weather_impact,
@@ -171,32 +444,23 @@ class PredictiveAlgorithm:
     
     def _calculate_solar_gain(self, forecast_time: datetime, cloud_cover: float) -> float:
         """Calculate solar heat gain"""
-        hour = forecast_time.hour
-        
-        # Simple solar curve (peak at noon)
-        if 6 <= hour <= 18:
-            # Solar elevation approximation
-            solar_elevation = np.sin(np.pi * (hour - 6) / 12)
-            
-            # Cloud reduction
-            cloud_reduction = 1.0 - (cloud_cover / 100 * 0.8)
-            
-            # Maximum solar gain adjusted by factors
-            max_solar_gain = 2.0  # °C equivalent
-            solar_gain = max_solar_gain * solar_elevation * cloud_reduction * self.solar_gain_factor
-            
-            return max(0, solar_gain)
-        
-        return 0.0
+        # Simple solar curve (peak at noon), looked up by nearest cloud cover bin
+        cloud_bin = min(10, max(0, round(cloud_cover / 10)))
+        return float(self._solar_lut[forecast_time.hour, cloud_bin]) * self.solar_gain_factor
     
-    async def _predict_heat_demand(self, comfort_target: float, 
-                                  weather_data: Dict[str, Any],
-                                  current_status: Dict[str, Any],
-                                  hour_offset: int) -> float:
+    def _predict_heat_demand(self, comfort_target: float, 
+                             weather_data: Dict[str, Any],
+                             current_status: Dict[str, Any],
+                             hour_offset: int,
+                             now: Optional[datetime] = None,
+                             confidence: Optional[float] = None) -> float:
         """Predict heat demand for maintaining comfort"""
         
+        if now is None:
+            now = datetime.now()
+        
         outside_temp = weather_data.get('temperature', 10)
-        weather_impact = self._calculate_weather_impact(weather_data, datetime.now() + timedelta(hours=hour_offset))
+        weather_impact = self._calculate_weather_impact(weather_data, now + timedelta(hours=hour_offset))
         
         # Base heat demand (temperature difference)
         temp_difference = comfort_target - outside_temp
@@ -205,15 +469,8 @@ class PredictiveAlgorithm:
         # Adjust for weather impacts
         adjusted_demand = base_demand - weather_impact['total_impact']
         
-        # Building thermal mass factor
-        mass_factors = {'low': 1.2, 'medium': 1.0, 'high': 0.8}
-        mass_factor = mass_factors.get(self.building_mass, 1.0)
-        
-        # Heating system efficiency factor
-        system_factors = {'radiator': 1.1, 'underfloor': 0.9, 'mixed': 1.0}
-        system_factor = system_factors.get(self.heating_system, 1.0)
-        
-        final_demand = adjusted_demand * mass_factor * system_factor
+        # Building thermal mass and heating system efficiency
+        final_demand = adjusted_demand * self._combined_factor
         
         # Use learning engine if available
         learned_demand = self.learning_engine.predict_energy_consumption({
@@ -222,27 +479,34 @@ class PredictiveAlgorithm:
             'humidity': weather_data.get('humidity', 50),
             'wind_speed': weather_data.get('wind_speed', 0),
             'cloud_cover': weather_data.get('clouds', 0),
-            'hour_of_day': (datetime.now() + timedelta(hours=hour_offset)).hour,
-            'day_of_week': datetime.now().weekday(),
-            'month': datetime.now().month,
+            'hour_of_day': (now.hour + hour_offset) % 24,
+            'day_of_week': now.weekday(),
+            'month': now.month,
             'building_mass': self.learning_engine._encode_building_mass(self.building_mass)
         })
         
         if learned_demand is not None:
             # Blend learned and calculated demand
-            confidence = self.learning_engine.get_learning_confidence()
+            if confidence is None:
+                confidence = self.learning_engine.get_learning_confidence()
             final_demand = final_demand * (1 - confidence) + learned_demand * confidence
         
         return max(0, final_demand)
     
-    async def _predict_system_response(self, heat_demand: float, 
-                                      weather_data: Dict[str, Any],
-                                      current_status: Dict[str, Any]) -> Dict[str, Any]:
+    def _predict_system_response(self, heat_demand: float, 
+                                 weather_data: Dict[str, Any],
+                                 current_status: Dict[str, Any],
+                                 now: Optional[datetime] = None,
+                                 confidence: Optional[float] = None) -> Dict[str, Any]:
         """Predict how the system will respond to heat demand"""
         
+        if now is None:
+            now = datetime.now()
+        
         # Current system state
-        current_room_temp = current_status.get('temperatures', {}).get('room', 20)
-        current_outlet_temp = current_status.get('temperatures', {}).get('outlet', 30)
+        temps = current_status.get('temperatures') or {}
+        current_room_temp = temps.get('room', 20)
+        current_outlet_temp = temps.get('outlet', 30)
         
         # Predict energy consumption
         predicted_energy = heat_demand * 1.2  # Simple conversion factor
@@ -259,20 +523,24 @@ class PredictiveAlgorithm:
             'wind_speed': weather_data.get('wind_speed', 0),
             'cloud_cover': weather_data.get('clouds', 0),
             'room_temp': current_room_temp,
-            'hour_of_day': datetime.now().hour,
-            'day_of_week': datetime.now().weekday(),
-            'month': datetime.now().month,
+            'hour_of_day': now.hour,
+            'day_of_week': now.weekday(),
+            'month': now.month,
             'building_mass': self.learning_engine._encode_building_mass(self.building_mass)
         })
         
         if learned_cop is not None:
-            confidence = self.learning_engine.get_learning_confidence()
+            if confidence is None:
+                confidence = self.learning_engine.get_learning_confidence()
             predicted_cop = predicted_cop * (1 - confidence) + learned_cop * confidence
         
+        # Keep the clamp and the returned values on plain Python floats
+        predicted_cop = float(predicted_cop)
+        
         # Predict room temperature response
         thermal_lag = self.learning_engine.calculate_thermal_lag(self.building_mass, self.heating_system)
-        temp_response = heat_demand * 0.5 * (1 - np.exp(-1 / thermal_lag))
-        predicted_room_temp = current_room_temp + temp_response
+        temp_response = heat_demand * 0.5 * self._thermal_response_coeff(thermal_lag)
+        predicted_room_temp = float(current_room_temp + temp_response)
         
         return {
             'room_temp': predicted_room_temp,
@@ -281,6 +549,13 @@ class PredictiveAlgorithm:
             'thermal_lag_used': thermal_lag
         }
     
+    def _thermal_response_coeff(self, thermal_lag: float) -> float:
+        """Fraction of the room temperature response reached after one hour"""
+        if thermal_lag != self._response_lag:
+            self._response_lag = thermal_lag
+            self._response_coeff = 1.0 - math.exp(-1.0 / max(1e-3, thermal_lag))
+        return self._response_coeff
+    
     def _calculate_expected_cop(self, outside_temp: float, outlet_temp: float) -> float:
         """Calculate expected COP based on temperatures"""
         # Simplified COP calculation based on temperature difference
@@ -295,190 +570,169 @@ class PredictiveAlgorithm:
         
         return max(2.0, min(6.0, practical_cop))
     
-    async def _calculate_control_actions(self, current_status: Dict[str, Any], 
-                                       predictions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _calculate_control_actions(self, current_temp: float, 
+                                   predictions: Dict[str, np.ndarray],
+                                   thermal_lag: Optional[float] = None,
+                                   confidence: Optional[float] = None) -> Dict[str, Any]:
         """Calculate required control actions based on predictions"""
         
+        if confidence is None:
+            confidence = self.learning_engine.get_learning_confidence()
+        
         control_result = {
             'action_needed': False,
             'settings': {},
-            'confidence': self.learning_engine.get_learning_confidence(),
+            'confidence': confidence,
             'reasoning': []
         }
         
-        if not predictions:
+        comfort_targets = predictions['comfort_target']
+        if not len(comfort_targets):
             return control_result
         
-        current_temp = current_status.get('temperatures', {}).get('room', 20)
-        current_target = current_status.get('temperatures', {}).get('target', 21)
+        # Candidate (target, reasons) pairs in increasing priority - the last one applies
+        candidates = []
         
         # Analyze next few hours for proactive control
-        immediate_predictions = predictions[:6]  # Next 6 hours
+        immediate_targets = comfort_targets[:6]  # Next 6 hours
         
         # Check if we need to start heating early due to thermal lag
-        thermal_lag = self.learning_engine.calculate_thermal_lag(self.building_mass, self.heating_system)
+        if thermal_lag is None:
+            thermal_lag = self.learning_engine.calculate_thermal_lag(self.building_mass, self.heating_system)
         
         # Find upcoming temperature needs
-        upcoming_targets = [p['comfort_target'] for p in immediate_predictions]
-        max_upcoming_target = max(upcoming_targets) if upcoming_targets else current_target
+        max_upcoming_target = float(immediate_targets.max())
         
         # Calculate lead time needed
         temp_increase_needed = max_upcoming_target - current_temp
         
         if temp_increase_needed > 1.0:  # Significant temperature increase needed
-            # Calculate when to start heating
-            hours_ahead_to_start = min(thermal_lag, len(predictions))
+            # Calculate how long heating up to the upcoming target takes
+            lead_time = self._time_to_reach(
+                max_upcoming_target, current_temp, float(predictions['heat_demand'][0]), thermal_lag
+            )
             
-            # Check if we should start heating now for future demand
-            future_prediction = predictions[int(hours_ahead_to_start)] if hours_ahead_to_start < len(predictions) else predictions[-1]
+            # Start heating now if the demand arrives within that lead time
+            need_hour = int(np.argmax(immediate_targets > current_temp + 0.5))
             
-            if future_prediction['comfort_target'] > current_temp + 0.5:
-                control_result['action_needed'] = True
-                control_result['settings']['target_temperature'] = max_upcoming_target
-                control_result['reasoning'].append(f"Proactive heating for {hours_ahead_to_start:.1f}h thermal lag")
+            if need_hour <= lead_time:
+                candidates.append((max_upcoming_target, [f"Proactive heating for {lead_time:.1f}h lead time"]))
         
         # Check for immediate comfort issues
-        immediate_target = predictions[0]['comfort_target']
+        immediate_target = float(comfort_targets[0])
         temp_error = immediate_target - current_temp
         
         if abs(temp_error) > 0.5:  # More than 0.5°C error
-            control_result['action_needed'] = True
-            
             # Calculate optimal target temperature considering predictions
-            optimal_target = self._calculate_optimal_target(predictions, current_status)
-            control_result['settings']['target_temperature'] = optimal_target
-            control_result['reasoning'].append(f"Temperature error: {temp_error:.1f}°C")
+            optimal_target = self._calculate_optimal_target(predictions, thermal_lag)
+            candidates.append((optimal_target, [f"Temperature error: {temp_error:.1f}°C"]))
         
-        # Energy optimization check
-        energy_optimization = self._calculate_energy_optimization(predictions)
-        if energy_optimization['action_needed']:
-            control_result['action_needed'] = True
-            control_result['settings'].update(energy_optimization['settings'])
-            control_result['reasoning'].extend(energy_optimization['reasoning'])
+        # Energy optimization and weather-based adjustments relative to the current comfort target
+        for adjustments in (self._calculate_energy_optimization(predictions),
+                            self._calculate_weather_adjustments(predictions)):
+            if adjustments:
+                total = sum(delta for delta, _ in adjustments)
+                candidates.append((immediate_target + total, [reason for _, reason in adjustments]))
         
-        # Weather-based adjustments
-        weather_adjustments = self._calculate_weather_adjustments(predictions)
-        if weather_adjustments['action_needed']:
+        if candidates:
             control_result['action_needed'] = True
-            control_result['settings'].update(weather_adjustments['settings'])
-            control_result['reasoning'].extend(weather_adjustments['reasoning'])
+            control_result['settings']['target_temperature'] = candidates[-1][0]
+            control_result['reasoning'] = [reason for _, reasons in candidates for reason in reasons]
         
         return control_result
     
-    def _calculate_optimal_target(self, predictions: List[Dict[str, Any]], 
-                                 current_status: Dict[str, Any]) -> float:
+    def _time_to_reach(self, target: float, start_temp: float, 
+                       heat_demand: float, thermal_lag: float) -> float:
+        """Hours until the room reaches the target temperature"""
+        temp_rise = target - start_temp
+        if temp_rise <= 0:
+            return 0.0
+        if heat_demand <= 0:
+            return math.inf
+        
+        # Inverse of T(t) = T0 + demand * 0.5 * (1 - exp(-t / lag))
+        return -thermal_lag * math.log(max(1e-6, 1 - 2 * temp_rise / heat_demand))
+    
+    def _calculate_optimal_target(self, predictions: Dict[str, np.ndarray], 
+                                  thermal_lag: Optional[float] = None) -> float:
         """Calculate optimal target temperature considering future needs"""
         
-        if not predictions:
+        comfort_targets = predictions['comfort_target']
+        if not len(comfort_targets):
             return self.target_temperature
         
-        # Weight near-term predictions more heavily
-        weighted_targets = []
-        weights = []
-        
-        for i, pred in enumerate(predictions[:12]):  # Next 12 hours
-            weight = 1.0 / (i + 1)  # Decreasing weight with time
-            weighted_targets.append(pred['comfort_target'] * weight)
-            weights.append(weight)
+        # Weight near-term predictions more heavily (next 12 hours)
+        count = min(12, len(comfort_targets))
+        targets = np.ascontiguousarray(comfort_targets[:count], dtype=np.float64)
         
-        if not weighted_targets:
-            return self.target_temperature
-        
-        optimal_target = sum(weighted_targets) / sum(weights)
+        optimal_target = float(_weighted_mean(targets, self._optimal_target_weights[:count]))
         
         # Adjust for thermal lag - if we need higher temperature later, increase now
-        thermal_lag = self.learning_engine.calculate_thermal_lag(self.building_mass, self.heating_system)
+        if thermal_lag is None:
+            thermal_lag = self.learning_engine.calculate_thermal_lag(self.building_mass, self.heating_system)
         lag_hours = int(thermal_lag)
         
-        if lag_hours < len(predictions):
-            future_target = predictions[lag_hours]['comfort_target']
-            current_target = predictions[0]['comfort_target']
+        if lag_hours < len(comfort_targets):
+            future_target = float(comfort_targets[lag_hours])
+            current_target = float(comfort_targets[0])
             lag_adjustment = (future_target - current_target) * 0.5
             optimal_target += lag_adjustment
         
         # Clamp to reasonable bounds
         return max(15.0, min(30.0, optimal_target))
     
-    def _calculate_energy_optimization(self, predictions: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Calculate energy optimization opportunities"""
+    def _calculate_energy_optimization(self, predictions: Dict[str, np.ndarray]) -> List[Tuple[float, str]]:
+        """Calculate energy optimization opportunities as (delta, reason) adjustments"""
         
-        result = {
-            'action_needed': False,
-            'settings': {},
-            'reasoning': []
-        }
+        adjustments = []
         
-        if len(predictions) < 6:
-            return result
+        solar_gain = predictions['solar_gain']
+        if len(solar_gain) < 6:
+            return adjustments
         
         # Look for periods of high solar gain
-        solar_periods = [p for p in predictions[:12] if p.get('solar_gain', 0) > 1.0]
+        window = solar_gain[:12]
+        solar_periods = window[window > 1.0]
         
-        if solar_periods:
+        if solar_periods.size:
             # During high solar gain, we can reduce heating slightly
-            avg_solar_gain = np.mean([p['solar_gain'] for p in solar_periods])
+            avg_solar_gain = float(solar_periods.mean())
             if avg_solar_gain > 1.5:
                 # Reduce target temperature slightly during solar gain periods
                 solar_reduction = min(1.0, avg_solar_gain * 0.3)
-                current_target = predictions[0]['comfort_target']
-                
-                result['action_needed'] = True
-                result['settings']['target_temperature'] = current_target - solar_reduction
-                result['reasoning'].append(f"Solar gain optimization: -{solar_reduction:.1f}°C")
+                adjustments.append((-solar_reduction, f"Solar gain optimization: -{solar_reduction:.1f}°C"))
         
         # Look for periods of low energy cost (if we had pricing data)
         # This would be where we pre-heat during cheap periods
         
-        return result
+        return adjustments
     
-    def _calculate_weather_adjustments(self, predictions: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Calculate weather-based control adjustments"""
+    def _calculate_weather_adjustments(self, predictions: Dict[str, np.ndarray]) -> List[Tuple[float, str]]:
+        """Calculate weather-based control adjustments as (delta, reason) adjustments"""
         
-        result = {
-            'action_needed': False,
-            'settings': {},
-            'reasoning': []
-        }
+        adjustments = []
         
-        if len(predictions) < 3:
-            return result
+        outside_temp = predictions['outside_temp']
+        if len(outside_temp) < 3:
+            return adjustments
         
         # Check for incoming cold weather
-        current_outside = predictions[0].get('outside_temp', 10)
-        future_outside_temps = [p.get('outside_temp', 10) for p in predictions[1:6]]
+        temp_drop = float(outside_temp[0] - outside_temp[1:6].min())
         
-        if future_outside_temps:
-            min_future_temp = min(future_outside_temps)
-            temp_drop = current_outside - min_future_temp
-            
-            if temp_drop > 5.0:  # Significant temperature drop expected
-                # Pre-heat to compensate for thermal lag
-                preheat_adjustment = min(2.0, temp_drop * 0.2)
-                
-                result['action_needed'] = True
-                current_target = predictions[0]['comfort_target']
-                result['settings']['target_temperature'] = current_target + preheat_adjustment
-                result['reasoning'].append(f"Cold weather preparation: +{preheat_adjustment:.1f}°C")
+        if temp_drop > 5.0:  # Significant temperature drop expected
+            # Pre-heat to compensate for thermal lag
+            preheat_adjustment = min(2.0, temp_drop * 0.2)
+            adjustments.append((preheat_adjustment, f"Cold weather preparation: +{preheat_adjustment:.1f}°C"))
         
         # Check for strong wind periods
-        wind_speeds = [p.get('weather_impact', {}).get('wind_loss', 0) for p in predictions[:6]]
-        if wind_speeds and max(wind_speeds) > 1.0:
-            max_wind_loss = max(wind_speeds)
+        max_wind_loss = float(predictions['wind_loss'][:6].max())
+        if max_wind_loss > 1.0:
             wind_adjustment = min(1.5, max_wind_loss * 0.5)
-            
-            if not result['action_needed']:
-                result['action_needed'] = True
-                current_target = predictions[0]['comfort_target']
-                result['settings']['target_temperature'] = current_target + wind_adjustment
-                result['reasoning'].append(f"Wind compensation: +{wind_adjustment:.1f}°C")
-            else:
-                # Add to existing adjustment
-                result['settings']['target_temperature'] += wind_adjustment
-                result['reasoning'].append(f"Wind compensation: +{wind_adjustment:.1f}°C")
+            adjustments.append((wind_adjustment, f"Wind compensation: +{wind_adjustment:.1f}°C"))
         
-        return result
+        return adjustments
     
-    async def _update_adaptive_parameters(self):
+    def _update_adaptive_parameters(self):
         """Update algorithm parameters based on learning"""
         
         # Get learning recommendations
@@ -503,6 +757,33 @@ class PredictiveAlgorithm:
                             f"Solar gain: {self.solar_gain_factor:.2f}, "
                             f"Wind factor: {self.wind_factor:.2f}")
     
+    def _record_history(self, timestamp: datetime, room_temp: float, outside_temp: float,
+                        target: float, action_needed: bool):
+        """Write a control decision into the history ring buffer"""
+        slot = self._history_idx % self._history_capacity
+        history = self.control_history
+        history['timestamp'][slot] = int(timestamp.timestamp())
+        history['room_temp'][slot] = room_temp
+        history['outside_temp'][slot] = outside_temp
+        history['target'][slot] = target
+        history['action_needed'][slot] = action_needed
+        self._history_idx += 1
+    
+    def get_control_history(self) -> Dict[str, np.ndarray]:
+        """Get recorded control decisions as arrays, oldest first"""
+        count = min(self._history_idx, self._history_capacity)
+        start = self._history_idx - count
+        order = np.arange(start, self._history_idx) % self._history_capacity
+        return {key: column[order] for key, column in self.control_history.items()}
+    
+    def warmup(self):
+        """Compile numeric kernels ahead of the first prediction"""
+        _weighted_mean(np.ones(2), np.ones(2))
+        
+        sample = np.ones(2)
+        _hourly_kernel(sample, sample, sample, sample, np.arange(2, dtype=np.int64), self._solar_lut,
+                       1.0, 1.0, 21.0, 19.0, 1.0)
+    
     def get_algorithm_status(self) -> Dict[str, Any]:
         """Get current algorithm status and parameters"""
         
@@ -5,20 +5,191 @@ Handles weather data retrieval from various APIs
 
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+import random
+from functools import lru_cache
+from itertools import chain, islice
+from math import radians, sin
+from time import time as _now
+from datetime import date, datetime, time
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional, Callable, Tuple, Union
 import aiohttp
-import json
+import numpy as np
 
-from astral import LocationInfo
-from astral.sun import sun
+from astral import LocationInfo, Observer
+from astral.sun import elevation, sun
+
+from compat import loads, njit
+from http_client import create_http_session
+
+
+RETRY_BACKOFF_MIN = 1    # First retry delay after a failed update in seconds
+RETRY_BACKOFF_MAX = 300  # Upper bound of the exponential retry delay
+
+# Endpoints per weather API provider
+_API_CONFIGS = MappingProxyType({
+    'openweathermap': {
+        'base_url': 'https://api.openweathermap.org/data/2.5',
+        'current_endpoint': '/weather',
+        'forecast_endpoint': '/forecast'
+    },
+    'weatherapi': {
+        'base_url': 'https://api.weatherapi.com/v1',
+        'current_endpoint': '/current.json',
+        'forecast_endpoint': '/forecast.json'
+    }
+})
+
+
+@lru_cache(maxsize=8)
+def _sun_times(latitude: float, longitude: float, day: date) -> Tuple[time, time]:
+    """Sunrise and sunset (UTC) for a location and day"""
+    s = sun(Observer(latitude, longitude), date=day)
+    return s['sunrise'].time(), s['sunset'].time()
+
+
+@njit(cache=True, fastmath=True)
+def _solar_elevation(seconds: np.ndarray, latitude: float, longitude: float) -> np.ndarray:
+    """Sun elevation in degrees for UTC epoch seconds (NOAA equations, no refraction)
+    
+    Compiled with numba where available, plain NumPy otherwise.
+    """
+    jc = (seconds / 86400.0 + 2440587.5 - 2451545.0) / 36525.0  # Julian century
+    
+    mean_long = np.radians((280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360)
+    mean_anom = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    eccentricity = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    center = (np.sin(mean_anom) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+              + np.sin(2 * mean_anom) * (0.019993 - 0.000101 * jc)
+              + np.sin(3 * mean_anom) * 0.000289)
+    
+    omega = np.radians(125.04 - 1934.136 * jc)
+    apparent_long = np.radians(np.degrees(mean_long) + center - 0.00569 - 0.00478 * np.sin(omega))
+    obliquity = np.radians(
+        23 + (26 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60) / 60
+        + 0.00256 * np.cos(omega)
+    )
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_long))
+    
+    y = np.tan(obliquity / 2) ** 2
+    equation_of_time = 4 * np.degrees(
+        y * np.sin(2 * mean_long) - 2 * eccentricity * np.sin(mean_anom)
+        + 4 * eccentricity * y * np.sin(mean_anom) * np.cos(2 * mean_long)
+        - 0.5 * y * y * np.sin(4 * mean_long) - 1.25 * eccentricity ** 2 * np.sin(2 * mean_anom)
+    )
+    
+    # True solar time in minutes and the hour angle derived from it
+    solar_time = (seconds % 86400 / 60.0 + equation_of_time + 4 * longitude) % 1440
+    hour_angle = np.radians(solar_time / 4 - 180)
+    
+    lat = np.radians(latitude)
+    cos_zenith = np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+    return 90.0 - np.degrees(np.arccos(np.clip(cos_zenith, -1.0, 1.0)))
+
+
+class Forecast:
+    """Hourly forecast stored column-wise
+    
+    Timestamps are kept as UTC epoch seconds and numeric fields as float64
+    arrays, descriptions as a list. Indexing, slicing and iteration behave
+    like the list of forecast dicts it replaces (with datetime timestamps),
+    column() gives vectorized consumers the arrays directly.
+    """
+    
+    NUMERIC_FIELDS = ('temperature', 'humidity', 'pressure', 'wind_speed', 'wind_direction', 'clouds')
+    
+    def __init__(self, epochs: np.ndarray = (), columns: Optional[Dict[str, np.ndarray]] = None,
+                 descriptions: List[str] = ()):
+        self.epochs = np.asarray(epochs, dtype=np.float64)
+        self.descriptions = list(descriptions)
+        columns = columns or {}
+        self._columns = {
+            name: np.asarray(columns[name], dtype=np.float64) if name in columns
+            else np.full(len(self.epochs), np.nan)
+            for name in self.NUMERIC_FIELDS
+        }
+    
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'Forecast':
+        """Create from forecast dicts with epoch or datetime timestamps (missing numeric fields are NaN)"""
+        return cls(
+            [
+                stamp.timestamp() if isinstance(stamp, datetime) else stamp
+                for stamp in (record['timestamp'] for record in records)
+            ],
+            {
+                name: np.fromiter((record.get(name, np.nan) for record in records),
+                                  dtype=np.float64, count=len(records))
+                for name in cls.NUMERIC_FIELDS
+            },
+            [record.get('description', '') for record in records]
+        )
+    
+    def merge(self, newer: 'Forecast', since: float) -> 'Forecast':
+        """Combine with a newer forecast, dropping entries before since
+        
+        Entries of the newer forecast replace ones for the same time, older
+        entries beyond its range are kept as the last known values.
+        """
+        keep = (self.epochs >= since) & ~np.isin(self.epochs, newer.epochs)
+        keep_newer = newer.epochs >= since
+        
+        epochs = np.concatenate((self.epochs[keep], newer.epochs[keep_newer]))
+        order = np.argsort(epochs, kind='stable')
+        descriptions = (
+            [d for d, k in zip(self.descriptions, keep) if k]
+            + [d for d, k in zip(newer.descriptions, keep_newer) if k]
+        )
+        
+        return Forecast(
+            epochs[order],
+            {
+                name: np.concatenate((self._columns[name][keep], newer.column(name)[keep_newer]))[order]
+                for name in self.NUMERIC_FIELDS
+            },
+            [descriptions[i] for i in order.tolist()]
+        )
+    
+    def __len__(self) -> int:
+        return len(self.epochs)
+    
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], 'Forecast']:
+        if isinstance(index, slice):
+            return Forecast(
+                self.epochs[index],
+                {name: column[index] for name, column in self._columns.items()},
+                self.descriptions[index]
+            )
+        
+        record = {'timestamp': datetime.fromtimestamp(self.epochs[index])}
+        for name, column in self._columns.items():
+            record[name] = column[index].item()
+        record['description'] = self.descriptions[index]
+        return record
+    
+    def __iter__(self):
+        return iter(self.records())
+    
+    @property
+    def timestamps(self) -> List[datetime]:
+        """Forecast times as local datetimes"""
+        return [datetime.fromtimestamp(epoch) for epoch in self.epochs.tolist()]
+    
+    def column(self, name: str) -> np.ndarray:
+        """Get the array of a numeric field"""
+        return self._columns[name]
+    
+    def records(self) -> List[Dict[str, Any]]:
+        """Get the forecast as a list of dicts"""
+        return [self[i] for i in range(len(self))]
 
 
 class WeatherService:
     """Weather service supporting multiple weather APIs"""
     
     def __init__(self, provider: str, api_key: str, latitude: float, 
-                 longitude: float, update_interval: int = 300):
+                 longitude: float, update_interval: int = 300,
+                 session: Optional[aiohttp.ClientSession] = None):
         self.logger = logging.getLogger(__name__)
         self.provider = provider.lower()
         self.api_key = api_key
@@ -26,10 +197,30 @@ class WeatherService:
         self.longitude = longitude
         self.update_interval = update_interval
         
+        # Shared HTTP session (owned by the caller). Without one the service
+        # creates its own on first use and keeps it until stop()
+        self.session = session
+        self._owns_session = False
+        self.request_timeout = aiohttp.ClientTimeout(total=10)
+        
+        # Delay requested by the provider's last rate limit response
+        self._retry_after = 0.0
+        
+        # Conditional request headers from the last current weather response
+        self._current_validators = {}
+        
         self.current_weather = {}
-        self.forecast_data = []
+        self.forecast_data = Forecast()
+        
+        # Weather summary and the current weather timestamp it was built for
+        self._summary_cache = None
+        self._summary_cache_key = None
+        
         self.running = False
         
+        # Callbacks notified after each successful data update
+        self.update_callbacks = []
+        
         # Setup location for solar calculations
         self.location = LocationInfo(
             name="Home",
@@ -39,18 +230,33 @@ class WeatherService:
             longitude=longitude
         )
         
-        # API configurations
-        self.api_configs = {
-            'openweathermap': {
-                'base_url': 'https://api.openweathermap.org/data/2.5',
-                'current_endpoint': '/weather',
-                'forecast_endpoint': '/forecast'
-            },
-            'weatherapi': {
-                'base_url': 'https://api.weatherapi.com/v1',
-                'current_endpoint': '/current.json',
-                'forecast_endpoint': '/forecast.json'
-            }
+        # Endpoint URLs and fetch methods of the configured provider
+        api_config = _API_CONFIGS.get(self.provider)
+        if api_config is not None:
+            self._current_url = api_config['base_url'] + api_config['current_endpoint']
+            self._forecast_url = api_config['base_url'] + api_config['forecast_endpoint']
+            self._fetch_current_fn = getattr(self, f'_fetch_{self.provider}_current')
+            self._fetch_forecast_fn = getattr(self, f'_fetch_{self.provider}_forecast')
+        else:
+            self._current_url = self._forecast_url = None
+            self._fetch_current_fn = self._fetch_forecast_fn = self._fetch_unsupported
+        
+        # Query parameters, identical for every request
+        self._owm_params = {
+            'lat': latitude,
+            'lon': longitude,
+            'appid': api_key,
+            'units': 'metric'
+        }
+        self._wapi_params = {
+            'key': api_key,
+            'q': f"{latitude},{longitude}",
+            'aqi': 'no'
+        }
+        self._wapi_forecast_params = {
+            **self._wapi_params,
+            'days': 2,  # Today + tomorrow
+            'alerts': 'no'
         }
         
     async def initialize(self) -> bool:
@@ -60,96 +266,168 @@ class WeatherService:
             return True
             
         try:
-            # Test API connection
-            async with aiohttp.ClientSession() as session:
-                current_data = await self._fetch_current_weather(session)
-                if current_data:
-                    self.logger.info(f"Weather service initialized with {self.provider}")
-                    return True
-                else:
-                    self.logger.error("Failed to fetch initial weather data")
-                    return False
+            # Test API connection, which also primes the DNS cache and the
+            # keep-alive connection for the first update
+            current_data = await self._fetch_current_weather()
+            if current_data:
+                # Keep the data, later updates may only get a 304 for it
+                self.current_weather = current_data
+                self._summary_cache_key = None
+                self.logger.info(f"Weather service initialized with {self.provider}")
+                return True
+            else:
+                self.logger.error("Failed to fetch initial weather data")
+                return False
                     
         except Exception as e:
             self.logger.error(f"Failed to initialize weather service: {e}")
             return False
     
     async def start_updates(self):
-        """Start periodic weather updates"""
+        """Start periodic weather updates
+        
+        Failed updates are retried with exponential backoff and jitter, capped
+        at the update interval. A Retry-After announced by a rate-limited
+        provider delays the next request at least that long.
+        """
         self.running = True
+        backoff = RETRY_BACKOFF_MIN
         while self.running:
             try:
-                await self._update_weather_data()
-                await asyncio.sleep(self.update_interval)
+                updated = await self._update_weather_data()
             except Exception as e:
                 self.logger.error(f"Error updating weather data: {e}")
-                await asyncio.sleep(60)  # Retry after 1 minute
+                updated = False
+            
+            if updated:
+                backoff = RETRY_BACKOFF_MIN
+                delay = self.update_interval
+            else:
+                delay = min(backoff + random.uniform(0, 1), self.update_interval)
+                backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
+            
+            delay = max(delay, self._retry_after)
+            self._retry_after = 0.0
+            await asyncio.sleep(delay)
     
     async def stop(self):
         """Stop weather updates"""
         self.running = False
+        
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+            self._owns_session = False
+    
+    def register_update_callback(self, callback: Callable[[], None]):
+        """Register a callback invoked after weather data was updated"""
+        self.update_callbacks.append(callback)
+    
+    def _notify_update(self):
+        """Notify registered callbacks about new data"""
+        for callback in self.update_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error(f"Error in update callback: {e}")
     
-    async def _update_weather_data(self):
-        """Update current weather and forecast data"""
+    async def _update_weather_data(self) -> bool:
+        """Update current weather and forecast data, True if any data was received"""
         if not self.api_key:
             self._generate_mock_data()
-            return
+            self._notify_update()
+            return True
             
         try:
-            async with aiohttp.ClientSession() as session:
-                # Fetch current weather
-                current_data = await self._fetch_current_weather(session)
-                if current_data:
-                    self.current_weather = current_data
-                    
-                # Fetch forecast
-                forecast_data = await self._fetch_forecast(session)
-                if forecast_data:
-                    self.forecast_data = forecast_data
-                    
+            # Fetch current weather and forecast concurrently, a failure of
+            # one request still keeps the result of the other
+            current_data, forecast_data = await asyncio.gather(
+                self._fetch_current_weather(), self._fetch_forecast(), return_exceptions=True
+            )
+            
+            if isinstance(current_data, Exception):
+                self.logger.error(f"Failed to fetch current weather: {current_data}")
+                current_data = None
+            elif current_data:
+                self.current_weather = current_data
+                self._summary_cache_key = None
+            
+            if isinstance(forecast_data, Exception):
+                self.logger.error(f"Failed to fetch weather forecast: {forecast_data}")
+                forecast_data = None
+            elif forecast_data:
+                # Keep the entry of the running hour, retain hours the new forecast lacks
+                self.forecast_data = self.forecast_data.merge(forecast_data, _now() - 3600)
+            
             self.logger.debug("Weather data updated successfully")
             
+            if current_data or forecast_data:
+                self._notify_update()
+                return True
+            
         except Exception as e:
             self.logger.error(f"Failed to update weather data: {e}")
+        
+        return False
+    
+    def _note_rate_limit(self, response: aiohttp.ClientResponse):
+        """Remember how long a rate-limited provider asked us to wait"""
+        try:
+            retry_after = float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            retry_after = float(self.update_interval)  # Missing or an HTTP date
+        
+        self._retry_after = max(self._retry_after, retry_after)
+        self.logger.warning(f"Weather API rate limit reached - retrying in {retry_after:.0f}s")
+    
+    def _remember_validators(self, response: aiohttp.ClientResponse):
+        """Keep ETag/Last-Modified so the next current weather request can get a 304"""
+        validators = {}
+        if 'ETag' in response.headers:
+            validators['If-None-Match'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            validators['If-Modified-Since'] = response.headers['Last-Modified']
+        self._current_validators = validators
+    
+    def _conditional_headers(self) -> Dict[str, str]:
+        """Validators for the current weather request, only sent when there is data to reuse"""
+        return self._current_validators if self.current_weather else {}
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, creating the service's own if needed"""
+        if self.session is None or (self._owns_session and self.session.closed):
+            self.session = create_http_session()
+            self._owns_session = True
+        return self.session
     
-    async def _fetch_current_weather(self, session: aiohttp.ClientSession) -> Optional[Dict[str, Any]]:
+    async def _fetch_current_weather(self) -> Optional[Dict[str, Any]]:
         """Fetch current weather data"""
-        if self.provider == 'openweathermap':
-            return await self._fetch_openweathermap_current(session)
-        elif self.provider == 'weatherapi':
-            return await self._fetch_weatherapi_current(session)
-        else:
-            self.logger.error(f"Unsupported weather provider: {self.provider}")
-            return None
+        return await self._fetch_current_fn()
     
-    async def _fetch_forecast(self, session: aiohttp.ClientSession) -> Optional[List[Dict[str, Any]]]:
+    async def _fetch_forecast(self) -> Optional[Forecast]:
         """Fetch weather forecast data"""
-        if self.provider == 'openweathermap':
-            return await self._fetch_openweathermap_forecast(session)
-        elif self.provider == 'weatherapi':
-            return await self._fetch_weatherapi_forecast(session)
-        else:
-            self.logger.error(f"Unsupported weather provider: {self.provider}")
-            return None
+        return await self._fetch_forecast_fn()
     
-    async def _fetch_openweathermap_current(self, session: aiohttp.ClientSession) -> Optional[Dict[str, Any]]:
+    async def _fetch_unsupported(self) -> None:
+        """Fetch stand-in for providers without an API configuration"""
+        self.logger.error(f"Unsupported weather provider: {self.provider}")
+        return None
+    
+    async def _fetch_openweathermap_current(self) -> Optional[Dict[str, Any]]:
         """Fetch current weather from OpenWeatherMap"""
+        headers = self._conditional_headers()
         try:
-            config = self.api_configs['openweathermap']
-            url = f"{config['base_url']}{config['current_endpoint']}"
-            
-            params = {
-                'lat': self.latitude,
-                'lon': self.longitude,
-                'appid': self.api_key,
-                'units': 'metric'
-            }
-            
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
+            session = self._get_session()
+            async with session.get(self._current_url, params=self._owm_params,
+                                   headers=headers,
+                                   timeout=self.request_timeout) as response:
+                if response.status == 304:
+                    if self.current_weather:
+                        return self.current_weather  # Unchanged since the last fetch
+                elif response.status == 200:
+                    data = loads(await response.read())
                     
-                    return {
+                    weather = {
                         'temperature': data['main']['temp'],
                         'humidity': data['main']['humidity'],
                         'pressure': data['main']['pressure'],
@@ -158,8 +436,13 @@ class WeatherService:
                         'clouds': data.get('clouds', {}).get('all', 0),
                         'visibility': data.get('visibility', 10000) / 1000,  # Convert to km
                         'description': data['weather'][0]['description'],
-                        'timestamp': datetime.now()
+                        'timestamp': _now()
                     }
+                    self._remember_validators(response)
+                    return weather
+                elif response.status == 429:
+                    self._note_rate_limit(response)
+                    return None
                 else:
                     self.logger.error(f"OpenWeatherMap API error: {response.status}")
                     return None
@@ -167,38 +450,42 @@ class WeatherService:
         except Exception as e:
             self.logger.error(f"Failed to fetch OpenWeatherMap current data: {e}")
             return None
+        
+        # 304 without data to reuse (cleared meanwhile), ask again without validators
+        if headers:
+            self._current_validators = {}
+            return await self._fetch_openweathermap_current()
+        return None
     
-    async def _fetch_openweathermap_forecast(self, session: aiohttp.ClientSession) -> Optional[List[Dict[str, Any]]]:
+    async def _fetch_openweathermap_forecast(self) -> Optional[Forecast]:
         """Fetch forecast from OpenWeatherMap"""
         try:
-            config = self.api_configs['openweathermap']
-            url = f"{config['base_url']}{config['forecast_endpoint']}"
-            
-            params = {
-                'lat': self.latitude,
-                'lon': self.longitude,
-                'appid': self.api_key,
-                'units': 'metric'
-            }
-            
-            async with session.get(url, params=params) as response:
+            session = self._get_session()
+            async with session.get(self._forecast_url, params=self._owm_params,
+                                   timeout=self.request_timeout) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = loads(await response.read())
                     
-                    forecast = []
-                    for item in data['list'][:24]:  # Next 24 hours (3-hour intervals)
-                        forecast.append({
-                            'timestamp': datetime.fromtimestamp(item['dt']),
-                            'temperature': item['main']['temp'],
-                            'humidity': item['main']['humidity'],
-                            'pressure': item['main']['pressure'],
-                            'wind_speed': item.get('wind', {}).get('speed', 0),
-                            'wind_direction': item.get('wind', {}).get('deg', 0),
-                            'clouds': item.get('clouds', {}).get('all', 0),
-                            'description': item['weather'][0]['description']
-                        })
+                    # Next 24 entries (3-hour intervals), read straight into columns
+                    items = data['list'][:24]
+                    winds = [item.get('wind') or {} for item in items]
+                    mains = [item['main'] for item in items]
                     
-                    return forecast
+                    return Forecast(
+                        [item['dt'] for item in items],
+                        {
+                            'temperature': [main['temp'] for main in mains],
+                            'humidity': [main['humidity'] for main in mains],
+                            'pressure': [main['pressure'] for main in mains],
+                            'wind_speed': [wind.get('speed', 0) for wind in winds],
+                            'wind_direction': [wind.get('deg', 0) for wind in winds],
+                            'clouds': [(item.get('clouds') or {}).get('all', 0) for item in items]
+                        },
+                        [item['weather'][0]['description'] for item in items]
+                    )
+                elif response.status == 429:
+                    self._note_rate_limit(response)
+                    return None
                 else:
                     self.logger.error(f"OpenWeatherMap forecast API error: {response.status}")
                     return None
@@ -207,24 +494,22 @@ class WeatherService:
             self.logger.error(f"Failed to fetch OpenWeatherMap forecast: {e}")
             return None
     
-    async def _fetch_weatherapi_current(self, session: aiohttp.ClientSession) -> Optional[Dict[str, Any]]:
+    async def _fetch_weatherapi_current(self) -> Optional[Dict[str, Any]]:
         """Fetch current weather from WeatherAPI"""
+        headers = self._conditional_headers()
         try:
-            config = self.api_configs['weatherapi']
-            url = f"{config['base_url']}{config['current_endpoint']}"
-            
-            params = {
-                'key': self.api_key,
-                'q': f"{self.latitude},{self.longitude}",
-                'aqi': 'no'
-            }
-            
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
+            session = self._get_session()
+            async with session.get(self._current_url, params=self._wapi_params,
+                                   headers=headers,
+                                   timeout=self.request_timeout) as response:
+                if response.status == 304:
+                    if self.current_weather:
+                        return self.current_weather  # Unchanged since the last fetch
+                elif response.status == 200:
+                    data = loads(await response.read())
                     current = data['current']
                     
-                    return {
+                    weather = {
                         'temperature': current['temp_c'],
                         'humidity': current['humidity'],
                         'pressure': current['pressure_mb'],
@@ -233,8 +518,13 @@ class WeatherService:
                         'clouds': current['cloud'],
                         'visibility': current['vis_km'],
                         'description': current['condition']['text'],
-                        'timestamp': datetime.now()
+                        'timestamp': _now()
                     }
+                    self._remember_validators(response)
+                    return weather
+                elif response.status == 429:
+                    self._note_rate_limit(response)
+                    return None
                 else:
                     self.logger.error(f"WeatherAPI error: {response.status}")
                     return None
@@ -242,47 +532,42 @@ class WeatherService:
         except Exception as e:
             self.logger.error(f"Failed to fetch WeatherAPI current data: {e}")
             return None
+        
+        # 304 without data to reuse (cleared meanwhile), ask again without validators
+        if headers:
+            self._current_validators = {}
+            return await self._fetch_weatherapi_current()
+        return None
     
-    async def _fetch_weatherapi_forecast(self, session: aiohttp.ClientSession) -> Optional[List[Dict[str, Any]]]:
+    async def _fetch_weatherapi_forecast(self) -> Optional[Forecast]:
         """Fetch forecast from WeatherAPI"""
         try:
-            config = self.api_configs['weatherapi']
-            url = f"{config['base_url']}{config['forecast_endpoint']}"
-            
-            params = {
-                'key': self.api_key,
-                'q': f"{self.latitude},{self.longitude}",
-                'days': 2,  # Today + tomorrow
-                'aqi': 'no',
-                'alerts': 'no'
-            }
-            
-            async with session.get(url, params=params) as response:
+            session = self._get_session()
+            async with session.get(self._forecast_url, params=self._wapi_forecast_params,
+                                   timeout=self.request_timeout) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = loads(await response.read())
                     
-                    forecast = []
-                    for day in data['forecast']['forecastday']:
-                        for hour in day['hour']:
-                            if datetime.fromtimestamp(hour['time_epoch']) > datetime.now():
-                                forecast.append({
-                                    'timestamp': datetime.fromtimestamp(hour['time_epoch']),
-                                    'temperature': hour['temp_c'],
-                                    'humidity': hour['humidity'],
-                                    'pressure': hour['pressure_mb'],
-                                    'wind_speed': hour['wind_kph'] / 3.6,  # Convert to m/s
-                                    'wind_direction': hour['wind_degree'],
-                                    'clouds': hour['cloud'],
-                                    'description': hour['condition']['text']
-                                })
-                                
-                                if len(forecast) >= 24:  # Limit to 24 hours
-                                    break
-                        
-                        if len(forecast) >= 24:
-                            break
+                    # Upcoming hours of today and tomorrow, limited to 24 hours
+                    now = _now()
+                    hours = chain.from_iterable(day['hour'] for day in data['forecast']['forecastday'])
+                    upcoming = list(islice((hour for hour in hours if hour['time_epoch'] > now), 24))
                     
-                    return forecast
+                    return Forecast(
+                        [hour['time_epoch'] for hour in upcoming],
+                        {
+                            'temperature': [hour['temp_c'] for hour in upcoming],
+                            'humidity': [hour['humidity'] for hour in upcoming],
+                            'pressure': [hour['pressure_mb'] for hour in upcoming],
+                            'wind_speed': np.array([hour['wind_kph'] for hour in upcoming]) / 3.6,  # m/s
+                            'wind_direction': [hour['wind_degree'] for hour in upcoming],
+                            'clouds': [hour['cloud'] for hour in upcoming]
+                        },
+                        [hour['condition']['text'] for hour in upcoming]
+                    )
+                elif response.status == 429:
+                    self._note_rate_limit(response)
+                    return None
                 else:
                     self.logger.error(f"WeatherAPI forecast error: {response.status}")
                     return None
@@ -293,7 +578,7 @@ class WeatherService:
     
     def _generate_mock_data(self):
         """Generate mock weather data for testing"""
-        now = datetime.now()
+        now = _now()
         
         # Generate realistic mock current weather
         self.current_weather = {
@@ -307,62 +592,99 @@ class WeatherService:
             'description': 'partly cloudy',
             'timestamp': now
         }
+        self._summary_cache_key = None
         
         # Generate mock forecast
-        self.forecast_data = []
-        for i in range(24):
-            self.forecast_data.append({
-                'timestamp': now + timedelta(hours=i),
-                'temperature': 8.5 + (i * 0.2) - (i > 12 and (i - 12) * 0.3 or 0),
-                'humidity': 65 + (i % 5 - 2) * 5,
-                'pressure': 1013.25 + (i % 7 - 3),
-                'wind_speed': 3.2 + (i % 3) * 0.5,
-                'wind_direction': 225,
-                'clouds': 40 + (i % 4) * 10,
-                'description': 'partly cloudy'
-            })
+        i = np.arange(24)
+        temperature = 8.5 + i * 0.2 - np.where(i > 12, (i - 12) * 0.3, 0)
+        humidity = 65 + (i % 5 - 2) * 5
+        pressure = 1013.25 + (i % 7 - 3)
+        wind_speed = 3.2 + (i % 3) * 0.5
+        clouds = 40 + (i % 4) * 10
+        
+        self.forecast_data = Forecast(
+            now + i * 3600.0,
+            {
+                'temperature': temperature,
+                'humidity': humidity,
+                'pressure': pressure,
+                'wind_speed': wind_speed,
+                'wind_direction': np.full(24, 225.0),
+                'clouds': clouds
+            },
+            ['partly cloudy'] * 24
+        )
     
     async def get_current_weather(self) -> Dict[str, Any]:
         """Get current weather data"""
         return self.current_weather
     
-    async def get_forecast(self, hours: int = 24) -> List[Dict[str, Any]]:
+    async def get_forecast(self, hours: int = 24) -> Forecast:
         """Get weather forecast for specified hours"""
         return self.forecast_data[:hours]
     
+    async def get_forecast_records(self, hours: int = 24) -> List[Dict[str, Any]]:
+        """Get weather forecast for specified hours as a list of dicts"""
+        return self.forecast_data[:hours].records()
+    
     def calculate_solar_radiation(self, timestamp: datetime, cloud_cover: float) -> float:
         """Calculate solar radiation based on sun position and cloud cover"""
         try:
-            s = sun(self.location.observer, date=timestamp.date())
+            sunrise, sunset = _sun_times(self.latitude, self.longitude, timestamp.date())
             
             # Check if sun is up
-            if timestamp.time() < s['sunrise'].time() or timestamp.time() > s['sunset'].time():
+            if timestamp.time() < sunrise or timestamp.time() > sunset:
                 return 0.0
             
             # Calculate sun elevation (simplified)
-            from astral.sun import elevation
             sun_elevation = elevation(self.location.observer, timestamp)
             
-            if sun_elevation <= 0:
-                return 0.0
-            
-            # Maximum theoretical solar radiation (simplified)
-            max_radiation = 1000  # W/m²
-            
-            # Adjust for sun elevation
-            elevation_factor = sin(radians(sun_elevation)) if sun_elevation > 0 else 0
-            
-            # Adjust for cloud cover
-            cloud_factor = 1.0 - (cloud_cover / 100.0 * 0.8)
-            
-            radiation = max_radiation * elevation_factor * cloud_factor
-            
-            return max(0, radiation)
+            # Maximum theoretical solar radiation (1000 W/m², simplified) scaled by
+            # the sun elevation (none below the horizon) and reduced by up to 80%
+            # at full cloud cover
+            return max(0.0, 1000.0 * max(0.0, sin(radians(sun_elevation))) * (1.0 - cloud_cover * 0.008))
             
         except Exception as e:
             self.logger.error(f"Failed to calculate solar radiation: {e}")
             return 0.0
     
+    def calculate_solar_radiation_batch(self, timestamps: np.ndarray, cloud_cover: np.ndarray) -> np.ndarray:
+        """Solar radiation for many timestamps at once
+        
+        Vectorized counterpart of calculate_solar_radiation. Timestamps are
+        epoch seconds (e.g. Forecast.epochs) or datetimes, naive ones taken as
+        UTC like astral does. The sun elevation is computed without atmospheric
+        refraction, which lowers the result slightly when the sun is just above
+        the horizon.
+        """
+        seconds = np.asarray(timestamps)
+        if seconds.dtype.kind in 'iuf':
+            seconds = seconds.astype(np.int64).astype('datetime64[s]')
+        else:
+            seconds = seconds.astype('datetime64[s]')
+        days = seconds.astype('datetime64[D]')
+        time_of_day = (seconds - days).astype(np.int64)
+        seconds = seconds.astype(np.int64).astype(np.float64)
+        
+        # Daylight window per distinct day, empty where astral finds no sunrise
+        # (calculate_solar_radiation returns 0 there as well)
+        unique_days, day_index = np.unique(days, return_inverse=True)
+        window = np.empty((len(unique_days), 2), dtype=np.int64)
+        for i, day in enumerate(unique_days):
+            try:
+                sunrise, sunset = _sun_times(self.latitude, self.longitude, day.item())
+                window[i] = (sunrise.hour * 3600 + sunrise.minute * 60 + sunrise.second,
+                             sunset.hour * 3600 + sunset.minute * 60 + sunset.second)
+            except ValueError:
+                window[i] = (1, 0)
+        daylight = (time_of_day >= window[day_index, 0]) & (time_of_day <= window[day_index, 1])
+        
+        elevation_factor = np.maximum(np.sin(np.radians(
+            _solar_elevation(seconds, self.latitude, self.longitude)
+        )), 0.0)
+        radiation = 1000.0 * elevation_factor * (1.0 - np.asarray(cloud_cover, dtype=np.float64) * 0.008)
+        return np.where(daylight, np.maximum(radiation, 0.0), 0.0)
+    
     def get_weather_summary(self) -> Dict[str, Any]:
         """Get summary of current weather conditions"""
         if not self.current_weather:
@@ -370,29 +692,26 @@ class WeatherService:
         
         current = self.current_weather
         
+        # Inputs only change with the weather updates
+        ts = current.get('timestamp') or _now()
+        if ts == self._summary_cache_key:
+            return dict(self._summary_cache)
+        
         # Calculate solar radiation
         solar_radiation = self.calculate_solar_radiation(
-            current['timestamp'], 
+            datetime.fromtimestamp(ts),
             current.get('clouds', 0)
         )
         
-        return {
+        self._summary_cache = {
             'outside_temperature': current.get('temperature', 0),
             'humidity': current.get('humidity', 50),
             'wind_speed': current.get('wind_speed', 0),
             'cloud_cover': current.get('clouds', 0),
             'solar_radiation': solar_radiation,
             'weather_description': current.get('description', 'unknown'),
-            'timestamp': current.get('timestamp', datetime.now())
+            'timestamp': ts
         }
-
-
-def sin(angle_rad: float) -> float:
-    """Calculate sine of angle in radians"""
-    import math
-    return math.sin(angle_rad)
-
-def radians(angle_deg: float) -> float:
-    """Convert degrees to radians"""
-    import math
-    return math.radians(angle_deg)
\ No newline at end of file
+        self._summary_cache_key = ts
+        
+        return dict(self._summary_cache)
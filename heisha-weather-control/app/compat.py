@@ -0,0 +1,63 @@
+"""
+Compatibility helpers for Heisha Weather Prediction Control
+Optional accelerated dependencies with standard library fallbacks
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit - functions run as plain Python"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        
+        def decorator(func):
+            return func
+        
+        return decorator
+
+
+def _default(obj: Any) -> Any:
+    """Serialize types the JSON encoders do not handle natively"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    
+    # NumPy scalars and arrays
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize object to JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    
+    def dumps(obj: Any) -> str:
+        """Serialize object to a JSON string"""
+        return dumps_bytes(obj).decode('utf-8')
+    
+    loads = orjson.loads
+else:
+    def dumps(obj: Any) -> str:
+        """Serialize object to a JSON string"""
+        return json.dumps(obj, default=_default)
+    
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize object to JSON bytes"""
+        return dumps(obj).encode('utf-8')
+    
+    loads = json.loads
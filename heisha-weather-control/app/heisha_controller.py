@@ -6,35 +6,138 @@ Handles communication with the heat pump and status monitoring
 import asyncio
 import json
 import logging
+import re
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from collections.abc import Mapping
+from typing import Dict, Any, Optional, Callable
 
 from mqtt_client import MQTTClient
 
+# Plain decimal payloads such as "35", "-2.5" (no exponents, nan or inf)
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+# 1-wire sensor readings are stored as "sensor_<name>" parameters
+SENSOR_KEY_PREFIX = 'sensor_'
+
+# Parameters whose updates are logged at debug level
+_IMPORTANT_PARAMS = frozenset(('Heatpump_State', 'Main_Outlet_Temp', 'Room_Thermostat_Temp'))
+
+# Seconds without HeishaMon data before warning, and minimum spacing of health checks
+STALE_DATA_TIMEOUT = 300
+HEALTH_CHECK_INTERVAL = 60
+
+# Status section keys and the HeishaMon parameters they are read from
+_TEMPERATURE_PARAMS = (
+    ('outlet', 'Main_Outlet_Temp'),
+    ('inlet', 'Main_Inlet_Temp'),
+    ('outside', 'Outside_Temp'),
+    ('room', 'Room_Thermostat_Temp'),
+    ('target', 'Z1_Heat_Request_Temp')
+)
+_SYSTEM_PARAMS = (
+    ('state', 'Heatpump_State'),
+    ('mode', 'Operating_Mode_State'),
+    ('pump_frequency', 'Pump_Freq'),
+    ('compressor_frequency', 'Compressor_Freq'),
+    ('energy_consumption', 'Energy_Consumption'),
+    ('energy_production', 'Energy_Production')
+)
+
+
+class HeishaStatus(Mapping):
+    """Read-only heat pump status snapshot
+    
+    Behaves like the status dict returned by HeishaController.get_status, but
+    the temperatures, system and sensors sections are only built when they are
+    first accessed.
+    """
+    
+    __slots__ = ('_values', '_sensors', '_sections')
+    
+    _KEYS = ('timestamp', 'connected', 'last_update', 'temperatures', 'system', 'sensors')
+    
+    def __init__(self, values: Dict[str, Any], sensors: Dict[str, float],
+                 timestamp: datetime, last_update: Optional[datetime]):
+        self._values = values
+        self._sensors = sensors
+        self._sections = {
+            'timestamp': timestamp,
+            'connected': last_update is not None,
+            'last_update': last_update
+        }
+    
+    def __getitem__(self, key: str) -> Any:
+        sections = self._sections
+        if key in sections:
+            return sections[key]
+        
+        values = self._values
+        if key == 'temperatures':
+            section = {name: values.get(param) for name, param in _TEMPERATURE_PARAMS}
+        elif key == 'system':
+            section = {name: values.get(param) for name, param in _SYSTEM_PARAMS}
+            
+            # Calculate COP if we have the data
+            consumption = section['energy_consumption']
+            production = section['energy_production']
+            if consumption and production and consumption > 0:
+                section['cop'] = production / consumption
+        elif key == 'sensors':
+            section = self._sensors
+        else:
+            raise KeyError(key)
+        
+        sections[key] = section
+        return section
+    
+    def __iter__(self):
+        return iter(self._KEYS)
+    
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
 
 class HeishaController:
     """Controller for Panasonic heat pump via HeishaMon"""
     
+    # Operating modes
+    heat_pump_modes = {
+        0: 'off',
+        1: 'heat',
+        2: 'cool',
+        3: 'auto'
+    }
+    _MODE_MAPPING = {name: value for value, name in heat_pump_modes.items()}
+    
     def __init__(self, mqtt_client: MQTTClient, config: Dict[str, Any]):
         self.logger = logging.getLogger(__name__)
         self.mqtt_client = mqtt_client
         self.config = config
         
-        # Heat pump status
-        self.current_status = {}
+        # Subscription topics are fixed once the topic prefix is known
+        prefix = config['mqtt']['topic_prefix']
+        self._main_topic = f"{prefix}/main/+"
+        self._sensor_topic = f"{prefix}/1wire/+"
+        
+        # Heat pump status: latest value and receive time per parameter
+        self.parameter_values = {}
+        self.parameter_timestamps = {}
+        self.sensor_values = {}
         self.last_update = None
+        self._last_update_mono = None  # time.monotonic() of last_update, for staleness checks
         
         # Control parameters
-        self.min_runtime = timedelta(minutes=config['advanced']['min_runtime_minutes'])
-        self.max_modulation = config['advanced']['max_modulation']
+        advanced = config['advanced']
+        self.min_runtime = timedelta(minutes=advanced['min_runtime_minutes'])
+        self.max_modulation = advanced['max_modulation']
         
-        # Operating modes
-        self.heat_pump_modes = {
-            0: 'off',
-            1: 'heat',
-            2: 'cool', 
-            3: 'auto'
-        }
+        # Callbacks notified whenever new HeishaMon data arrives
+        self.update_callbacks = []
+        
+        # Set by incoming MQTT data to wake monitor_status
+        self._loop = None
+        self._data_event = asyncio.Event()
         
         self.running = False
         
@@ -43,13 +146,13 @@ class HeishaController:
         try:
             # Subscribe to HeishaMon status topics
             self.mqtt_client.subscribe_to_topic(
-                f"{self.config['mqtt']['topic_prefix']}/main/",
+                self._main_topic,
                 self._on_heishamon_data
             )
             
             # Subscribe to 1-wire sensor topics  
             self.mqtt_client.subscribe_to_topic(
-                f"{self.config['mqtt']['topic_prefix']}/1wire/",
+                self._sensor_topic,
                 self._on_sensor_data
             )
             
@@ -57,80 +160,113 @@ class HeishaController:
             return True
             
         except Exception as e:
-            self.logger.error(f"Failed to initialize Heisha controller: {e}")
+            self.logger.error("Failed to initialize Heisha controller: %s", e)
             return False
     
+    def register_update_callback(self, callback: Callable[[], None]):
+        """Register a callback invoked when new heat pump data arrives
+        
+        Callbacks run on the event loop while MQTT messages are read and must
+        not block.
+        """
+        self.update_callbacks.append(callback)
+    
+    def _notify_update(self):
+        """Notify registered callbacks about new data"""
+        # Wake the status monitor (safe to call from any thread)
+        if self._loop is not None and not self._data_event.is_set():
+            self._loop.call_soon_threadsafe(self._data_event.set)
+        
+        for callback in self.update_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error("Error in update callback: %s", e)
+    
     def _on_heishamon_data(self, topic: str, data: Any):
         """Handle incoming HeishaMon data"""
         try:
             # Extract parameter name from topic
-            topic_parts = topic.split('/')
-            if len(topic_parts) >= 3:
-                param_name = topic_parts[-1]
+            _, sep, param_name = topic.rpartition('/')
+            if sep and param_name:
                 
                 # Convert numeric strings to numbers
-                if isinstance(data, str) and data.replace('.', '').replace('-', '').isdigit():
+                if isinstance(data, str) and _NUMBER_RE.fullmatch(data):
                     data = float(data) if '.' in data else int(data)
                 
-                self.current_status[param_name] = {
-                    'value': data,
-                    'timestamp': datetime.now()
-                }
+                now = datetime.now()
+                self.parameter_values[param_name] = data
+                self.parameter_timestamps[param_name] = now
                 
-                self.last_update = datetime.now()
+                self.last_update = now
+                self._last_update_mono = time.monotonic()
                 
                 # Log important status changes
-                if param_name in ['Heatpump_State', 'Main_Outlet_Temp', 'Room_Thermostat_Temp']:
-                    self.logger.debug(f"HeishaMon update: {param_name} = {data}")
+                if param_name in _IMPORTANT_PARAMS:
+                    self.logger.debug("HeishaMon update: %s = %s", param_name, data)
+                
+                self._notify_update()
                     
         except Exception as e:
-            self.logger.error(f"Error processing HeishaMon data: {e}")
+            self.logger.error("Error processing HeishaMon data: %s", e)
     
     def _on_sensor_data(self, topic: str, data: Any):
         """Handle 1-wire sensor data"""
         try:
-            topic_parts = topic.split('/')
-            if len(topic_parts) >= 3:
-                sensor_name = topic_parts[-1]
+            _, sep, sensor_name = topic.rpartition('/')
+            if sep and sensor_name:
                 
-                if isinstance(data, str) and data.replace('.', '').replace('-', '').isdigit():
+                if isinstance(data, str) and _NUMBER_RE.fullmatch(data):
                     data = float(data)
                 
-                self.current_status[f"sensor_{sensor_name}"] = {
-                    'value': data,
-                    'timestamp': datetime.now()
-                }
+                key = SENSOR_KEY_PREFIX + sensor_name
+                self.parameter_values[key] = data
+                self.parameter_timestamps[key] = datetime.now()
+                self.sensor_values[sensor_name] = data
+                
+                self._notify_update()
                 
         except Exception as e:
-            self.logger.error(f"Error processing sensor data: {e}")
+            self.logger.error("Error processing sensor data: %s", e)
     
     async def monitor_status(self):
-        """Monitor heat pump status continuously"""
+        """Monitor heat pump status continuously
+        
+        Sleeps until new HeishaMon data arrives and checks the system health at
+        most once per HEALTH_CHECK_INTERVAL. Warns when no data was received for
+        STALE_DATA_TIMEOUT seconds.
+        """
         self.running = True
+        self._loop = asyncio.get_running_loop()
         
         while self.running:
             try:
-                # Check if we're receiving data
-                if self.last_update and (datetime.now() - self.last_update) > timedelta(minutes=5):
-                    self.logger.warning("No HeishaMon data received for 5 minutes")
+                try:
+                    await asyncio.wait_for(self._data_event.wait(), timeout=STALE_DATA_TIMEOUT)
+                except asyncio.TimeoutError:
+                    last = self._last_update_mono
+                    if last is not None and time.monotonic() - last > STALE_DATA_TIMEOUT:
+                        self.logger.warning("No HeishaMon data received for 5 minutes")
+                    continue
+                
+                self._data_event.clear()
                 
                 # Perform status checks
                 await self._check_system_health()
                 
-                await asyncio.sleep(60)  # Check every minute
+                await asyncio.sleep(HEALTH_CHECK_INTERVAL)
                 
             except Exception as e:
-                self.logger.error(f"Error in status monitoring: {e}")
-                await asyncio.sleep(60)
+                self.logger.error("Error in status monitoring: %s", e)
+                await asyncio.sleep(HEALTH_CHECK_INTERVAL)
     
     async def _check_system_health(self):
         """Check system health and log warnings"""
         try:
             # Check for error states
-            if 'Error' in self.current_status:
-                error_code = self.current_status['Error'].get('value', 0)
-                if error_code != 0:
-                    self.logger.warning(f"Heat pump error code: {error_code}")
+            error_code = self.parameter_values.get('Error', 0)
+            if error_code != 0:
+                self.logger.warning("Heat pump error code: %s", error_code)
             
             # Check temperatures
             outlet_temp = self.get_parameter('Main_Outlet_Temp')
@@ -139,61 +275,30 @@ class HeishaController:
             if outlet_temp and inlet_temp:
                 temp_diff = outlet_temp - inlet_temp
                 if temp_diff > 15:  # Unusual temperature difference
-                    self.logger.warning(f"High temperature difference: {temp_diff:.1f}°C")
+                    self.logger.warning("High temperature difference: %.1f°C", temp_diff)
             
             # Check pump frequency
             pump_freq = self.get_parameter('Pump_Freq')
             if pump_freq and pump_freq > 90:
-                self.logger.info(f"Heat pump running at high frequency: {pump_freq}%")
+                self.logger.info("Heat pump running at high frequency: %s%%", pump_freq)
                 
         except Exception as e:
-            self.logger.error(f"Error checking system health: {e}")
+            self.logger.error("Error checking system health: %s", e)
     
-    async def get_status(self) -> Dict[str, Any]:
+    async def get_status(self) -> 'HeishaStatus':
         """Get current heat pump status"""
-        status = {
-            'timestamp': datetime.now(),
-            'connected': self.last_update is not None,
-            'last_update': self.last_update,
-            'temperatures': {
-                'outlet': self.get_parameter('Main_Outlet_Temp'),
-                'inlet': self.get_parameter('Main_Inlet_Temp'), 
-                'outside': self.get_parameter('Outside_Temp'),
-                'room': self.get_parameter('Room_Thermostat_Temp'),
-                'target': self.get_parameter('Z1_Heat_Request_Temp')
-            },
-            'system': {
-                'state': self.get_parameter('Heatpump_State'),
-                'mode': self.get_parameter('Operating_Mode_State'),
-                'pump_frequency': self.get_parameter('Pump_Freq'),
-                'compressor_frequency': self.get_parameter('Compressor_Freq'),
-                'energy_consumption': self.get_parameter('Energy_Consumption'),
-                'energy_production': self.get_parameter('Energy_Production')
-            },
-            'sensors': self._get_sensor_data()
-        }
-        
-        # Calculate COP if we have the data
-        if status['system']['energy_consumption'] and status['system']['energy_production']:
-            if status['system']['energy_consumption'] > 0:
-                status['system']['cop'] = status['system']['energy_production'] / status['system']['energy_consumption']
-        
-        return status
+        return HeishaStatus(
+            self.parameter_values.copy(), self.sensor_values.copy(),
+            datetime.now(), self.last_update
+        )
     
     def get_parameter(self, param_name: str) -> Optional[float]:
         """Get a specific parameter value"""
-        if param_name in self.current_status:
-            return self.current_status[param_name].get('value')
-        return None
+        return self.parameter_values.get(param_name)
     
     def _get_sensor_data(self) -> Dict[str, float]:
         """Get all sensor data"""
-        sensors = {}
-        for key, data in self.current_status.items():
-            if key.startswith('sensor_'):
-                sensor_name = key[7:]  # Remove 'sensor_' prefix
-                sensors[sensor_name] = data.get('value')
-        return sensors
+        return self.sensor_values.copy()
     
     async def apply_settings(self, settings: Dict[str, Any]):
         """Apply new settings to the heat pump"""
@@ -214,42 +319,36 @@ class HeishaController:
             if 'force_defrost' in settings:
                 await self.force_defrost()
             
-            self.logger.info(f"Applied settings: {settings}")
+            self.logger.info("Applied settings: %s", settings)
             
         except Exception as e:
-            self.logger.error(f"Failed to apply settings: {e}")
+            self.logger.error("Failed to apply settings: %s", e)
     
     async def set_target_temperature(self, temperature: float):
         """Set target temperature for Zone 1"""
         # Validate temperature range
         if not (15.0 <= temperature <= 30.0):
-            self.logger.error(f"Temperature {temperature}°C outside valid range (15-30°C)")
+            self.logger.error("Temperature %s°C outside valid range (15-30°C)", temperature)
             return
         
         await self.mqtt_client.send_heisha_command('SetZ1HeatRequestTemperature', int(temperature))
-        self.logger.info(f"Set target temperature to {temperature}°C")
+        self.logger.info("Set target temperature to %s°C", temperature)
     
     async def set_heat_pump_mode(self, mode: str):
         """Set heat pump operating mode"""
-        mode_mapping = {
-            'off': 0,
-            'heat': 1,
-            'cool': 2,
-            'auto': 3
-        }
+        mode_value = self._MODE_MAPPING.get(mode.lower())
         
-        if mode.lower() in mode_mapping:
-            mode_value = mode_mapping[mode.lower()]
+        if mode_value is not None:
             await self.mqtt_client.send_heisha_command('SetHeatPump', mode_value)
-            self.logger.info(f"Set heat pump mode to {mode}")
+            self.logger.info("Set heat pump mode to %s", mode)
         else:
-            self.logger.error(f"Invalid heat pump mode: {mode}")
+            self.logger.error("Invalid heat pump mode: %s", mode)
     
     async def set_quiet_mode(self, enabled: bool):
         """Enable or disable quiet mode"""
         value = 1 if enabled else 0
         await self.mqtt_client.send_heisha_command('SetQuietMode', value)
-        self.logger.info(f"{'Enabled' if enabled else 'Disabled'} quiet mode")
+        self.logger.info("%s quiet mode", 'Enabled' if enabled else 'Disabled')
     
     async def force_defrost(self):
         """Force defrost cycle"""
@@ -260,7 +359,7 @@ class HeishaController:
         """Enable or disable holiday mode"""
         value = 1 if enabled else 0
         await self.mqtt_client.send_heisha_command('SetHolidayMode', value)
-        self.logger.info(f"{'Enabled' if enabled else 'Disabled'} holiday mode")
+        self.logger.info("%s holiday mode", 'Enabled' if enabled else 'Disabled')
     
     def is_heating_active(self) -> bool:
         """Check if heating is currently active"""
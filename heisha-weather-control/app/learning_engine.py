@@ -3,18 +3,486 @@ Learning Engine for Heisha Weather Prediction Control
 Machine learning algorithms for adaptive heat pump control
 """
 
-import json
+import asyncio
+import copy
+import itertools
 import logging
+import os
+import time
 import numpy as np
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import IO, Dict, Any, Callable, List, Mapping, Optional, Iterable, Tuple, Union
 from pathlib import Path
 
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error
 import pandas as pd
 
+from compat import HAS_NUMBA, dumps_bytes, loads, njit
+
+try:
+    from river import forest as river_forest
+    from river import metrics as river_metrics
+except ImportError:
+    river_forest = None
+
+
+# Columns of the learning sample store and their dtypes. Timestamps need
+# float64; measurements fit float32 and calendar fields int8.
+SAMPLE_COLUMNS = {
+    'timestamp': np.float64,
+    'outside_temp': np.float32,
+    'humidity': np.float32,
+    'wind_speed': np.float32,
+    'cloud_cover': np.float32,
+    'room_temp': np.float32,
+    'target_temp': np.float32,
+    'outlet_temp': np.float32,
+    'inlet_temp': np.float32,
+    'pump_freq': np.float32,
+    'compressor_freq': np.float32,
+    'energy_consumption': np.float32,
+    'energy_production': np.float32,
+    'cop': np.float32,
+    'predicted_temp': np.float32,
+    'predicted_cop': np.float32,
+    'hour_of_day': np.int8,
+    'day_of_week': np.int8,
+    'month': np.int8,
+    'building_mass': np.int8
+}
+
+# Model input columns, in the order of the feature matrix
+FEATURE_COLUMNS = (
+    'outside_temp', 'humidity', 'wind_speed', 'cloud_cover',
+    'room_temp', 'target_temp', 'hour_of_day', 'day_of_week',
+    'month', 'building_mass'
+)
+
+
+# Sample fields read from the first forecast hour, the status temperatures,
+# the status system values and the prediction: (column, source key, default)
+_WEATHER_FIELDS = (
+    ('outside_temp', 'temperature', 0), ('humidity', 'humidity', 50),
+    ('wind_speed', 'wind_speed', 0), ('cloud_cover', 'clouds', 0)
+)
+_TEMPERATURE_FIELDS = (
+    ('room_temp', 'room', 20), ('target_temp', 'target', 21),
+    ('outlet_temp', 'outlet', 0), ('inlet_temp', 'inlet', 0)
+)
+_SYSTEM_FIELDS = (
+    ('pump_freq', 'pump_frequency', 0), ('compressor_freq', 'compressor_frequency', 0),
+    ('energy_consumption', 'energy_consumption', 0), ('energy_production', 'energy_production', 0),
+    ('cop', 'cop', 0)
+)
+_PREDICTION_FIELDS = (
+    ('predicted_temp', 'target_temperature', 0), ('predicted_cop', 'predicted_cop', 0)
+)
+
+
+# Training target column per model
+MODEL_TARGETS = {
+    'temperature_response': 'outlet_temp',
+    'energy_consumption': 'energy_consumption',
+    'cop_prediction': 'cop'
+}
+TARGET_COLUMNS = tuple(MODEL_TARGETS.values())
+
+
+def _ffill(values: np.ndarray) -> np.ndarray:
+    """Forward-fill NaN values (leading NaNs stay NaN)"""
+    index = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(index, out=index)
+    return values[index]
+
+
+@njit(cache=True)
+def _select_rows_kernel(features: np.ndarray, target: np.ndarray, min_target: float):
+    """Forward-fill target and gather the feature rows whose target exceeds min_target
+    
+    One pass picks the rows, a second copies them into the training matrix.
+    """
+    size = target.shape[0]
+    rows = np.empty(size, dtype=np.int64)
+    values = np.empty(size, dtype=target.dtype)
+    
+    # Forward fill and pick the rows
+    last = np.nan
+    count = 0
+    for i in range(size):
+        if not np.isnan(target[i]):
+            last = target[i]
+        if last > min_target:
+            rows[count] = i
+            values[count] = last
+            count += 1
+    
+    selected = np.empty((count, features.shape[1]), dtype=features.dtype)
+    for k in range(count):
+        selected[k] = features[rows[k]]
+    return selected, values[:count]
+
+
+def _select_rows(features: np.ndarray, target: np.ndarray,
+                 min_target: float = -np.inf) -> Tuple[np.ndarray, np.ndarray]:
+    """Training rows for a target column
+    
+    Missing targets are forward-filled, then only rows whose target exceeds
+    min_target are kept (rows before the first target value never are).
+    """
+    if HAS_NUMBA:
+        return _select_rows_kernel(features, target, min_target)
+    
+    filled = _ffill(target)
+    valid = filled > min_target
+    return features[valid], filled[valid]
+
+
+def _moments(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Pearson sums (n, sum_x, sum_y, sum_xx, sum_yy, sum_xy) over pairs where both values are present"""
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x = x[valid].astype(np.float64)
+    y = y[valid].astype(np.float64)
+    return np.array([len(x), x.sum(), y.sum(), np.dot(x, x), np.dot(y, y), np.dot(x, y)])
+
+
+def _pearson(moments: np.ndarray) -> float:
+    """Pearson correlation from the sums returned by _moments
+    
+    Matches pandas Series.corr: NaN when fewer than two pairs are summed or
+    either side is constant.
+    """
+    n, sum_x, sum_y, sum_xx, sum_yy, sum_xy = moments
+    if n < 2:
+        return float('nan')
+    var_x = n * sum_xx - sum_x ** 2
+    var_y = n * sum_yy - sum_y ** 2
+    # Sums that went through removals are not exact, treat leftovers as zero
+    if var_x <= 1e-9 * n * sum_xx or var_y <= 1e-9 * n * sum_yy:
+        return float('nan')
+    return float((n * sum_xy - sum_x * sum_y) / np.sqrt(var_x * var_y))
+
+
+class SampleStatistics:
+    """Running sums over the samples for the adaptation analyses
+    
+    Covers the weather/energy correlations per sample and the target vs room
+    temperature changes between consecutive samples. SampleStore adds and
+    subtracts the sums of appended and expired samples only, so reading a
+    statistic does not depend on the number of samples stored.
+    """
+    
+    # Column pairs correlated per sample
+    CORRELATIONS = {
+        'cloud_energy': ('cloud_cover', 'energy_consumption'),
+        'wind_energy': ('wind_speed', 'energy_consumption'),
+    }
+    SIGNIFICANT_TARGET_CHANGE = 0.5  # °C
+    
+    def __init__(self):
+        self._moments = {name: np.zeros(6) for name in self.CORRELATIONS}
+        self._step_moments = np.zeros(6)
+        # Significant target changes, their absolute sum, room changes measured
+        # at those steps and their absolute sum
+        self._response = np.zeros(4)
+    
+    def add_samples(self, columns: Mapping[str, np.ndarray], sign: float = 1.0):
+        """Add (sign 1) or remove (sign -1) the sums of samples"""
+        for name, (x, y) in self.CORRELATIONS.items():
+            self._moments[name] += sign * _moments(columns[x], columns[y])
+    
+    def add_steps(self, columns: Mapping[str, np.ndarray], sign: float = 1.0):
+        """Add or remove the sums of the changes between consecutive samples"""
+        target_change = np.diff(columns['target_temp'])
+        room_change = np.diff(columns['room_temp'])
+        self._step_moments += sign * _moments(target_change, room_change)
+        
+        significant = np.abs(target_change) > self.SIGNIFICANT_TARGET_CHANGE
+        response = np.abs(room_change[significant])
+        response = response[~np.isnan(response)]
+        self._response += sign * np.array([
+            np.count_nonzero(significant), np.abs(target_change[significant]).sum(dtype=np.float64),
+            len(response), response.sum(dtype=np.float64)
+        ])
+    
+    def correlation(self, name: str) -> float:
+        """Correlation of one of the CORRELATIONS pairs"""
+        return _pearson(self._moments[name])
+    
+    def step_correlation(self) -> float:
+        """Correlation between target and room temperature changes"""
+        return _pearson(self._step_moments)
+    
+    def response(self) -> Tuple[int, float]:
+        """Count of significant target changes and the mean room/target change ratio
+        
+        The ratio is NaN when no room change was measured at those steps.
+        """
+        steps, target_sum, measured, room_sum = self._response
+        steps = int(round(steps))
+        if not steps or not round(measured):
+            return steps, float('nan')
+        return steps, (room_sum / round(measured)) / (target_sum / steps)
+
+
+# Values used for features missing from a conditions dict
+_FEATURE_DEFAULTS = (
+    ('outside_temp', 0), ('humidity', 50), ('wind_speed', 0), ('cloud_cover', 0),
+    ('room_temp', 20), ('target_temp', 21), ('hour_of_day', 12), ('day_of_week', 0),
+    ('month', 1), ('building_mass', 2.0)
+)
+
+
+# Stored for missing sample fields: NaN, or the feature default in integer
+# columns, which cannot hold NaN
+_MISSING_VALUES = {
+    name: dict(_FEATURE_DEFAULTS).get(name, 0) if np.issubdtype(dtype, np.integer) else np.nan
+    for name, dtype in SAMPLE_COLUMNS.items()
+}
+
+
+def _feature_rows(conditions: Iterable[Dict[str, Any]]) -> np.ndarray:
+    """Build a feature matrix (FEATURE_COLUMNS order) from conditions dicts"""
+    return np.array(
+        [[c.get(name, default) for name, default in _FEATURE_DEFAULTS] for c in conditions],
+        dtype=np.float64
+    ).reshape(-1, len(_FEATURE_DEFAULTS))
+
+
+def _scale(scaler: StandardScaler, features: np.ndarray) -> np.ndarray:
+    """Apply a fitted StandardScaler without sklearn's input validation"""
+    return (features - scaler.mean_) / scaler.scale_
+
+
+def _forest_predict(model: RandomForestRegressor, features: np.ndarray) -> np.ndarray:
+    """Average the tree predictions of a fitted forest
+    
+    Same result as model.predict, without the input validation and joblib
+    dispatch that dominate the cost for a few rows.
+    """
+    X = np.ascontiguousarray(features, dtype=np.float32)
+    total = np.zeros(len(X))
+    for estimator in model.estimators_:
+        total += estimator.tree_.predict(X)[:, 0]
+    return total / len(model.estimators_)
+
+
+def _flatten_forest(model: RandomForestRegressor) -> Tuple[np.ndarray, ...]:
+    """Node arrays of all trees of a fitted forest, padded to the largest tree
+    
+    Returns (feature, threshold, left, right, value), each shaped
+    (n_trees, max_nodes). Leaves have left == -1.
+    """
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    shape = (len(trees), max(tree.node_count for tree in trees))
+    
+    feature = np.zeros(shape, dtype=np.intp)
+    threshold = np.zeros(shape)
+    left = np.full(shape, -1, dtype=np.intp)
+    right = np.full(shape, -1, dtype=np.intp)
+    value = np.zeros(shape)
+    
+    for i, tree in enumerate(trees):
+        nodes = tree.node_count
+        feature[i, :nodes] = np.maximum(tree.feature, 0)  # Leaves are marked -2
+        threshold[i, :nodes] = tree.threshold
+        left[i, :nodes] = tree.children_left
+        right[i, :nodes] = tree.children_right
+        value[i, :nodes] = tree.value[:, 0, 0]
+    
+    return feature, threshold, left, right, value
+
+
+@njit(cache=True)
+def _flat_forest_predict(features: np.ndarray, feature: np.ndarray, threshold: np.ndarray,
+                         left: np.ndarray, right: np.ndarray, value: np.ndarray) -> np.ndarray:
+    """Average the leaf values of all flattened trees for each float32 feature row
+    
+    Splits compare like sklearn (float32 feature <= float64 threshold), the
+    child is selected arithmetically instead of branching.
+    """
+    n_trees = feature.shape[0]
+    predictions = np.empty(features.shape[0])
+    for row in range(features.shape[0]):
+        total = 0.0
+        for tree in range(n_trees):
+            node = 0
+            while left[tree, node] != -1:
+                go_right = features[row, feature[tree, node]] > threshold[tree, node]
+                node = left[tree, node] + go_right * (right[tree, node] - left[tree, node])
+            total += value[tree, node]
+        predictions[row] = total / n_trees
+    return predictions
+
+
+# Columns read by SampleStatistics
+_STATISTICS_COLUMNS = ('cloud_cover', 'wind_speed', 'energy_consumption', 'target_temp', 'room_temp')
+
+
+class SampleStore:
+    """Time-ordered learning samples stored column-wise in NumPy arrays
+    
+    Samples are appended at the tail and expired from the head. Stored rows are
+    never overwritten in place, so column views and frames handed out stay valid
+    after later appends. Missing values are stored as NaN.
+    
+    Every change assigns a new generation, unique across all stores, so results
+    computed from the samples can be cached until the next change.
+    """
+    
+    _MIN_CAPACITY = 256
+    _generations = itertools.count()
+    
+    def __init__(self, rows: Iterable[Dict[str, Any]] = ()):
+        self._columns = {
+            name: np.empty(self._MIN_CAPACITY, dtype=dtype)
+            for name, dtype in SAMPLE_COLUMNS.items()
+        }
+        self._start = 0
+        self._end = 0
+        self.statistics = SampleStatistics()
+        self._changed()
+        self.extend(rows)
+    
+    def __len__(self) -> int:
+        return self._end - self._start
+    
+    def _changed(self):
+        """Invalidate the cached frame and start a new generation"""
+        self._frame = None
+        self.generation = next(self._generations)
+    
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        """Get a single sample as a dict"""
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("sample index out of range")
+        
+        row = self._start + index
+        return {name: column[row].item() for name, column in self._columns.items()}
+    
+    def __iter__(self):
+        return iter(self.records())
+    
+    def append(self, row: Dict[str, Any]):
+        """Append a single sample"""
+        self.extend((row,))
+    
+    def extend(self, rows: Iterable[Dict[str, Any]]):
+        """Append samples, growing the column arrays if needed"""
+        rows = list(rows)
+        count = len(rows)
+        if not count:
+            return
+        
+        size = len(self)
+        if self._end + count > len(self._columns['timestamp']):
+            # Reallocate (dropping expired head rows) with room to grow
+            capacity = max(self._MIN_CAPACITY, 2 * (size + count))
+            columns = {}
+            for name, column in self._columns.items():
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:size] = column[self._start:self._end]
+                columns[name] = grown
+            self._columns = columns
+            self._start, self._end = 0, size
+        
+        end = self._end + count
+        for name, column in self._columns.items():
+            missing = _MISSING_VALUES[name]
+            column[self._end:end] = [row.get(name, missing) for row in rows]
+        
+        # New samples plus the step from the previous last sample
+        self.statistics.add_samples(self._slice(self._end, end))
+        self.statistics.add_steps(self._slice(max(self._start, self._end - 1), end))
+        self._end = end
+        self._changed()
+    
+    def expire(self, cutoff: float) -> int:
+        """Drop samples from the head up to the first one newer than cutoff"""
+        newer = self.column('timestamp') > cutoff
+        count = int(newer.argmax()) if newer.any() else len(newer)
+        
+        if count:
+            # Expired samples plus the step to the first remaining sample
+            self.statistics.add_samples(self._slice(self._start, self._start + count), -1.0)
+            self.statistics.add_steps(self._slice(self._start, min(self._start + count + 1, self._end)), -1.0)
+            self._start += count
+            self._changed()
+        
+        return count
+    
+    def _slice(self, start: int, end: int) -> Dict[str, np.ndarray]:
+        """Views of the statistics columns between two raw array positions"""
+        return {name: self._columns[name][start:end] for name in _STATISTICS_COLUMNS}
+    
+    def column(self, name: str) -> np.ndarray:
+        """Get a read-only view of a single column"""
+        view = self._columns[name][self._start:self._end]
+        view.flags.writeable = False
+        return view
+    
+    @property
+    def frame(self) -> pd.DataFrame:
+        """DataFrame view of all samples, cached until the store changes"""
+        if self._frame is None:
+            self._frame = pd.DataFrame(self.columns(), copy=False)
+        return self._frame
+    
+    @classmethod
+    def from_columns(cls, columns: Mapping[str, np.ndarray]) -> 'SampleStore':
+        """Create a store from equally long column arrays (missing columns are NaN)"""
+        store = cls()
+        size = len(columns['timestamp'])
+        store._columns = {
+            name: cls._as_column(name, columns[name]) if name in columns
+            else np.full(size, _MISSING_VALUES[name], dtype=dtype)
+            for name, dtype in SAMPLE_COLUMNS.items()
+        }
+        store._end = size
+        store.statistics.add_samples(store._slice(0, size))
+        store.statistics.add_steps(store._slice(0, size))
+        store._changed()
+        return store
+    
+    @staticmethod
+    def _as_column(name: str, values: np.ndarray) -> np.ndarray:
+        """Convert values (e.g. float64 columns of older archives) to a column's dtype"""
+        dtype = SAMPLE_COLUMNS[name]
+        values = np.asarray(values)
+        if np.issubdtype(dtype, np.integer) and values.dtype.kind == 'f':
+            values = np.where(np.isnan(values), _MISSING_VALUES[name], np.round(values))
+        return values.astype(dtype, copy=False)
+    
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Get read-only views of all columns"""
+        return {name: self.column(name) for name in self._columns}
+    
+    def records(self) -> List[Dict[str, Any]]:
+        """Get all samples as a list of dicts"""
+        values = [self.column(name).tolist() for name in self._columns]
+        return [dict(zip(self._columns, row)) for row in zip(*values)]
+
+
+def _sync(f: IO[bytes]):
+    """Flush a file to the storage device, so it survives a power loss"""
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _write_temporary(path: Path, write: Callable[[IO[bytes]], Any]) -> Path:
+    """Write a file's new contents next to it, for an atomic os.replace afterwards"""
+    temporary = path.with_name(path.name + '.tmp')
+    with open(temporary, 'wb') as f:
+        write(f)
+        _sync(f)
+    return temporary
+
 
 class LearningEngine:
     """Learning engine for adaptive heat pump control"""
@@ -28,13 +496,62 @@ class LearningEngine:
         self.learning_rate = config['advanced']['learning_rate']
         self.max_data_age_days = 365  # Keep data for 1 year
         self.min_samples_for_learning = 100
+        self.retrain_interval_samples = 30
+        
+        # Building mass feature, fixed by the configuration
+        self._building_mass = self._encode_building_mass(config['house']['building_thermal_mass'])
         
-        # Data storage
-        self.historical_data = []
+        # Incremental retraining - grow the forests on the most recent samples
+        # and refit from scratch every few retrains to bound drift
+        self.trees_per_retrain = 5
+        self.max_estimators = 100
+        self.incremental_window = 2000
+        self.full_refit_interval = 10
+        
+        # Bootstrap samples per tree, so retrain cost stops growing with the history
+        self.max_tree_samples = 5000
+        
+        # Data storage - observations in time order, oldest first
+        self.historical_data = SampleStore()
         self.models = {}
         self.scalers = {}
         self.model_accuracy = {}
         
+        # Sample analyses per name: (sample generation, result)
+        self._analysis_cache = {}
+        
+        # Persistence - new samples are appended to a log, which is compacted
+        # into the sample archive periodically. The file operations must run in
+        # submission order (a compaction after the appends it covers), which the
+        # multi-threaded default pool does not guarantee, hence a single writer
+        self.compaction_interval = 3600  # Seconds
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="heisha-data")
+        self._last_compaction = time.monotonic()
+        
+        # Background retraining - one fit at a time in its own thread, so a
+        # long fit never occupies the small default pool meant for quick I/O
+        self._retrain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="heisha-learn")
+        self._retrain_future = None
+        self._samples_since_retrain = 0
+        self._retrains_since_full_refit = None  # None until the first full refit
+        
+        # Bumped whenever trained models change, for caches of their predictions
+        self.model_version = 0
+        
+        # Running feature mean/variance, updated as samples arrive and used to
+        # scale the features on a full refit
+        self._feature_stats = StandardScaler()
+        
+        # Flattened trees per forest model for the compiled prediction kernel:
+        # model name -> (estimators list, tree count, node arrays)
+        self._flat_forests = {}
+        
+        # Online models (river) learn sample by sample instead of being retrained
+        self.online_learning = config['advanced'].get('online_learning', False)
+        if self.online_learning and river_forest is None:
+            self.logger.warning("online_learning requires the river package - using random forests")
+            self.online_learning = False
+        
         # Initialize models
         self._initialize_models()
         
@@ -43,12 +560,27 @@ class LearningEngine:
     
     def _initialize_models(self):
         """Initialize machine learning models"""
+        if self.online_learning:
+            # Aggregated Mondrian forests are trained online and need no scaling
+            for model_name in MODEL_TARGETS:
+                self.models[model_name] = river_forest.AMFRegressor(seed=42)
+            self._online_metrics = {model_name: river_metrics.MAE() for model_name in MODEL_TARGETS}
+            self._online_samples = dict.fromkeys(MODEL_TARGETS, 0)
+            
+            self.logger.info("Online learning models initialized")
+            return
+        
         model_params = {
             'n_estimators': 50,
             'max_depth': 10,
+            'max_features': 'sqrt',
+            'min_samples_leaf': 5,
+            'bootstrap': True,
             'random_state': 42,
-            'n_jobs': -1
+            'n_jobs': -1,
+            'warm_start': True
         }
+        self._base_estimators = model_params['n_estimators']
         
         # Model for predicting temperature response
         self.models['temperature_response'] = RandomForestRegressor(**model_params)
@@ -67,50 +599,53 @@ class LearningEngine:
     async def update_data(self, current_status: Dict[str, Any], 
                          weather_data: List[Dict[str, Any]], 
                          prediction: Dict[str, Any],
-                         timestamp: datetime):
-        """Update learning data with new observations"""
+                         timestamp: Union[float, datetime]):
+        """Update learning data with new observations
+        
+        The timestamp is a POSIX timestamp (as returned by time.time())
+        or a datetime.
+        """
+        await self.bulk_update([(current_status, weather_data, prediction, timestamp)])
+    
+    async def bulk_update(self, observations: Iterable[Tuple[Dict[str, Any], List[Dict[str, Any]],
+                                                            Dict[str, Any], Union[float, datetime]]]):
+        """Update learning data with a batch of observations
+        
+        Each observation is a (current_status, weather_data, prediction, timestamp)
+        tuple. Model retraining is started in the background at most once per
+        batch and only every retrain_interval_samples new samples.
+        """
         try:
-            # Create data point
-            data_point = {
-                'timestamp': timestamp.isoformat(),
-                'outside_temp': weather_data[0].get('temperature', 0) if weather_data else 0,
-                'humidity': weather_data[0].get('humidity', 50) if weather_data else 50,
-                'wind_speed': weather_data[0].get('wind_speed', 0) if weather_data else 0,
-                'cloud_cover': weather_data[0].get('clouds', 0) if weather_data else 0,
-                'room_temp': current_status.get('temperatures', {}).get('room', 20),
-                'target_temp': current_status.get('temperatures', {}).get('target', 21),
-                'outlet_temp': current_status.get('temperatures', {}).get('outlet', 0),
-                'inlet_temp': current_status.get('temperatures', {}).get('inlet', 0),
-                'pump_freq': current_status.get('system', {}).get('pump_frequency', 0),
-                'compressor_freq': current_status.get('system', {}).get('compressor_frequency', 0),
-                'energy_consumption': current_status.get('system', {}).get('energy_consumption', 0),
-                'energy_production': current_status.get('system', {}).get('energy_production', 0),
-                'cop': current_status.get('system', {}).get('cop', 0),
-                'predicted_temp': prediction.get('target_temperature', 0),
-                'predicted_cop': prediction.get('predicted_cop', 0),
-                'hour_of_day': timestamp.hour,
-                'day_of_week': timestamp.weekday(),
-                'month': timestamp.month,
-                'heating_system_type': self.config['house']['heating_system_type'],
-                'building_mass': self._encode_building_mass(self.config['house']['building_thermal_mass'])
-            }
+            data_points = [
+                self._create_data_point(current_status, weather_data, prediction, timestamp)
+                for current_status, weather_data, prediction, timestamp in observations
+            ]
             
-            # Add to historical data
-            self.historical_data.append(data_point)
+            added = len(data_points)
+            if not added:
+                return
             
-            # Keep only recent data
-            cutoff_date = timestamp - timedelta(days=self.max_data_age_days)
-            self.historical_data = [
-                dp for dp in self.historical_data 
-                if datetime.fromisoformat(dp['timestamp']) > cutoff_date
-            ]
+            self.historical_data.extend(data_points)
+            self._update_feature_stats(np.column_stack(
+                [self.historical_data.column(name)[-added:] for name in FEATURE_COLUMNS]
+            ))
+            
+            # Keep only recent data - expired samples are at the head
+            latest = max(dp['timestamp'] for dp in data_points)
+            self.historical_data.expire(latest - self.max_data_age_days * 86400)
             
-            # Retrain models if we have enough data
-            if len(self.historical_data) >= self.min_samples_for_learning:
-                await self._retrain_models()
+            if self.online_learning:
+                self._learn_online(data_points)
+            else:
+                # Retrain models in the background every few samples once we have enough data
+                self._samples_since_retrain += added
+                if (len(self.historical_data) >= self.min_samples_for_learning
+                        and self._samples_since_retrain >= self.retrain_interval_samples):
+                    self._schedule_retrain()
             
-            # Save data periodically
-            if len(self.historical_data) % 10 == 0:
+            # Append to the sample log, compact into the archive periodically
+            await self._append_samples(data_points)
+            if time.monotonic() - self._last_compaction >= self.compaction_interval:
                 await self.save_data()
             
             self.logger.debug(f"Updated learning data. Total samples: {len(self.historical_data)}")
@@ -118,6 +653,31 @@ class LearningEngine:
         except Exception as e:
             self.logger.error(f"Error updating learning data: {e}")
     
+    def _create_data_point(self, current_status: Dict[str, Any],
+                           weather_data: List[Dict[str, Any]],
+                           prediction: Dict[str, Any],
+                           timestamp: Union[float, datetime]) -> Dict[str, Any]:
+        """Create a learning data point from a single observation"""
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        local_time = time.localtime(timestamp)
+        
+        data_point = {'timestamp': timestamp}
+        for fields, source in (
+            (_WEATHER_FIELDS, weather_data[0] if weather_data else {}),
+            (_TEMPERATURE_FIELDS, current_status.get('temperatures', {})),
+            (_SYSTEM_FIELDS, current_status.get('system', {})),
+            (_PREDICTION_FIELDS, prediction)
+        ):
+            for name, key, default in fields:
+                data_point[name] = source.get(key, default)
+        
+        data_point['hour_of_day'] = local_time.tm_hour
+        data_point['day_of_week'] = local_time.tm_wday
+        data_point['month'] = local_time.tm_mon
+        data_point['building_mass'] = self._building_mass
+        return data_point
+    
     def _encode_building_mass(self, mass_type: str) -> float:
         """Encode building mass type as numeric value"""
         mass_mapping = {
@@ -127,73 +687,192 @@ class LearningEngine:
         }
         return mass_mapping.get(mass_type, 2.0)
     
+    def _learn_online(self, data_points: Iterable[Dict[str, Any]]):
+        """Update the online models sample by sample
+        
+        Each sample is predicted before it is learned, so the tracked MAE is a
+        progressive validation error.
+        """
+        learned = set()
+        
+        for dp in data_points:
+            x = {}
+            for name in FEATURE_COLUMNS:
+                value = dp.get(name)
+                x[name] = 0.0 if value is None or value != value else value  # Missing as 0
+            
+            for model_name, target in MODEL_TARGETS.items():
+                y = dp.get(target)
+                if y is None or y != y or (target == 'cop' and y <= 0):
+                    continue
+                
+                model = self.models[model_name]
+                if self._online_samples[model_name]:
+                    y_pred = model.predict_one(x)
+                    if y_pred is not None:
+                        self._online_metrics[model_name].update(y, y_pred)
+                
+                model.learn_one(x, y)
+                self._online_samples[model_name] += 1
+                learned.add(model_name)
+        
+        if learned:
+            self.model_version += 1
+        
+        trained_at = datetime.now().isoformat()
+        for model_name in learned:
+            self.model_accuracy[model_name] = {
+                'mae': self._online_metrics[model_name].get(),
+                'samples': self._online_samples[model_name],
+                'trained_at': trained_at
+            }
+    
+    def _schedule_retrain(self):
+        """Retrain the models in the background unless a retrain is running"""
+        if self._retrain_future is not None and not self._retrain_future.done():
+            return
+        
+        self._samples_since_retrain = 0
+        self._retrain_future = asyncio.ensure_future(self._retrain_models())
+    
     async def _retrain_models(self):
-        """Retrain machine learning models with recent data"""
+        """Retrain machine learning models with recent data
+        
+        Fitting runs in a dedicated worker thread; the fitted models replace the
+        current ones on the event loop once all of them are done.
+        """
         try:
-            if len(self.historical_data) < self.min_samples_for_learning:
+            store = self.historical_data
+            if len(store) < self.min_samples_for_learning:
                 return
             
-            df = pd.DataFrame(self.historical_data)
+            # Column views stay valid while new samples are appended
+            columns = {name: store.column(name) for name in (*FEATURE_COLUMNS, *TARGET_COLUMNS)}
             
-            # Prepare features for different models
-            feature_columns = [
-                'outside_temp', 'humidity', 'wind_speed', 'cloud_cover',
-                'room_temp', 'target_temp', 'hour_of_day', 'day_of_week', 
-                'month', 'building_mass'
-            ]
+            retrains = self._retrains_since_full_refit
+            full_refit = retrains is None or retrains >= self.full_refit_interval
             
-            X = df[feature_columns].fillna(0)
+            # Snapshot of the running statistics for the new scalers
+            feature_stats = None
+            if full_refit and hasattr(self._feature_stats, 'mean_'):
+                feature_stats = copy.deepcopy(self._feature_stats)
             
-            # Retrain temperature response model
-            if 'outlet_temp' in df.columns and not df['outlet_temp'].isna().all():
-                y_temp = df['outlet_temp'].fillna(method='forward')
-                await self._train_model('temperature_response', X, y_temp)
+            fitted = await asyncio.get_running_loop().run_in_executor(
+                self._retrain_executor, self._fit_models, columns, full_refit, feature_stats
+            )
             
-            # Retrain energy consumption model  
-            if 'energy_consumption' in df.columns and not df['energy_consumption'].isna().all():
-                y_energy = df['energy_consumption'].fillna(method='forward')
-                await self._train_model('energy_consumption', X, y_energy)
+            for model_name, (model, scaler, accuracy, flat) in fitted.items():
+                self.models[model_name] = model
+                self.scalers[model_name] = scaler
+                self.model_accuracy[model_name] = accuracy
+                if flat is not None:
+                    self._flat_forests[model_name] = (model.estimators_, len(model.estimators_), flat)
             
-            # Retrain COP prediction model
-            if 'cop' in df.columns and not df['cop'].isna().all():
-                y_cop = df['cop'].fillna(method='forward')
-                y_cop = y_cop[y_cop > 0]  # Remove invalid COP values
-                if len(y_cop) > 10:
-                    X_cop = X.loc[y_cop.index]
-                    await self._train_model('cop_prediction', X_cop, y_cop)
+            if fitted:
+                self.model_version += 1
+                self._retrains_since_full_refit = 0 if full_refit else retrains + 1
             
-            self.logger.info("Models retrained successfully")
+            self.logger.info(f"Models retrained successfully ({'full refit' if full_refit else 'incremental'})")
             
         except Exception as e:
             self.logger.error(f"Error retraining models: {e}")
     
-    async def _train_model(self, model_name: str, X: pd.DataFrame, y: pd.Series):
-        """Train a specific model"""
+    def _update_feature_stats(self, X: np.ndarray):
+        """Fold new feature rows into the running mean/variance"""
+        np.nan_to_num(X, copy=False)  # Missing values are trained as 0
+        self._feature_stats.partial_fit(X)
+    
+    def _fit_models(self, columns: Dict[str, np.ndarray], full_refit: bool = True,
+                    feature_stats: Optional[StandardScaler] = None
+                    ) -> Dict[str, Tuple[Any, StandardScaler, Dict[str, Any], Optional[Tuple[np.ndarray, ...]]]]:
+        """Fit all models on the given sample columns (blocking)
+        
+        Returns (model, scaler, accuracy, flattened trees or None) per model.
+        """
+        fitted = {}
+        
+        # Prepare features for different models (missing values as 0), in the
+        # float32 the tree code works with
+        X = np.column_stack([columns[name] for name in FEATURE_COLUMNS]).astype(np.float32, copy=False)
+        np.nan_to_num(X, copy=False)
+        
+        # Retrain temperature response model
+        X_temp, y_temp = _select_rows(X, columns['outlet_temp'])
+        if len(y_temp):
+            fitted['temperature_response'] = self._train_model('temperature_response', X_temp, y_temp,
+                                                               full_refit, feature_stats)
+        
+        # Retrain energy consumption model
+        X_energy, y_energy = _select_rows(X, columns['energy_consumption'])
+        if len(y_energy):
+            fitted['energy_consumption'] = self._train_model('energy_consumption', X_energy, y_energy,
+                                                             full_refit, feature_stats)
+        
+        # Retrain COP prediction model
+        X_cop, y_cop = _select_rows(X, columns['cop'], 0.0)  # Remove missing and invalid COP values
+        if len(y_cop) > 10:
+            fitted['cop_prediction'] = self._train_model('cop_prediction', X_cop, y_cop,
+                                                         full_refit, feature_stats)
+        
+        # Flatten the new forests here rather than on their first prediction
+        return {
+            name: (*result, _flatten_forest(result[0]) if HAS_NUMBA else None)
+            for name, result in fitted.items() if result is not None
+        }
+    
+    def _train_model(self, model_name: str, X: np.ndarray, y: np.ndarray,
+                     full_refit: bool = True, feature_stats: Optional[StandardScaler] = None
+                     ) -> Optional[Tuple[Any, StandardScaler, Dict[str, Any]]]:
+        """Train a copy of a specific model (blocking)
+        
+        A full refit trains a fresh forest on all samples, scaled with the running
+        feature statistics (or a scaler fitted on X without them). Otherwise
+        a few trees are added to the current forest, fitted on the most recent
+        samples with the current scaler so the existing trees stay valid.
+        """
         try:
             if len(X) < 10:  # Need minimum samples
-                return
+                return None
             
-            # Scale features
-            X_scaled = self.scalers[model_name].fit_transform(X)
+            current = self.models[model_name]
+            grown = current.n_estimators + self.trees_per_retrain
             
-            # Train model
-            self.models[model_name].fit(X_scaled, y)
+            if full_refit or not hasattr(current, 'estimators_') or grown > self.max_estimators:
+                # Scale features
+                scaler = feature_stats if feature_stats is not None else StandardScaler().fit(X)
+                X_scaled = scaler.transform(X)
+                
+                # Train model
+                model = clone(current).set_params(n_estimators=self._base_estimators,
+                                                  max_samples=min(len(X), self.max_tree_samples))
+                model.fit(X_scaled, y)
+            else:
+                X = X[-self.incremental_window:]
+                y = y[-self.incremental_window:]
+                scaler = self.scalers[model_name]
+                X_scaled = scaler.transform(X)
+                
+                # Grow a copy so predictions keep using the current forest meanwhile
+                model = copy.deepcopy(current).set_params(n_estimators=grown,
+                                                          max_samples=min(len(X), self.max_tree_samples))
+                model.fit(X_scaled, y)
             
             # Calculate accuracy
-            y_pred = self.models[model_name].predict(X_scaled)
+            y_pred = model.predict(X_scaled)
             mae = mean_absolute_error(y, y_pred)
             
-            # Store accuracy
-            self.model_accuracy[model_name] = {
+            accuracy = {
                 'mae': mae,
                 'samples': len(X),
                 'trained_at': datetime.now().isoformat()
             }
             
             self.logger.debug(f"Trained {model_name} model. MAE: {mae:.3f}")
+            return model, scaler, accuracy
             
         except Exception as e:
             self.logger.error(f"Error training {model_name} model: {e}")
+            return None
     
     def predict_temperature_response(self, conditions: Dict[str, Any]) -> Optional[float]:
         """Predict outlet temperature based on conditions"""
@@ -207,42 +886,80 @@ class LearningEngine:
         """Predict coefficient of performance"""
         return self._make_prediction('cop_prediction', conditions)
     
-    def _make_prediction(self, model_name: str, conditions: Dict[str, Any]) -> Optional[float]:
-        """Make prediction using specified model"""
+    def predict_all(self, conditions: Dict[str, Any]) -> Dict[str, Optional[float]]:
+        """Predict with every model from a single feature row
+        
+        Returns the prediction per model name (None for untrained models).
+        """
+        features = _feature_rows((conditions,))
+        predictions = {}
+        for model_name in self.models:
+            prediction = self._make_batch_prediction(model_name, features)
+            predictions[model_name] = None if prediction is None else float(prediction[0])
+        return predictions
+    
+    def predict_batch(self, conditions: Iterable[Dict[str, Any]]) -> Dict[str, Optional[np.ndarray]]:
+        """Predict with every model for many conditions, one call per model"""
+        features = _feature_rows(conditions)
+        return {
+            model_name: self._make_batch_prediction(model_name, features)
+            for model_name in self.models
+        }
+    
+    def predict_energy_consumption_batch(self, features: np.ndarray) -> Optional[np.ndarray]:
+        """Predict energy consumption for a matrix of feature rows"""
+        return self._make_batch_prediction('energy_consumption', features)
+    
+    def predict_cop_batch(self, features: np.ndarray) -> Optional[np.ndarray]:
+        """Predict coefficient of performance for a matrix of feature rows"""
+        return self._make_batch_prediction('cop_prediction', features)
+    
+    def _make_batch_prediction(self, model_name: str, features: np.ndarray) -> Optional[np.ndarray]:
+        """Make predictions for many feature rows with a single model call
+        
+        Rows use the training column order: outside_temp, humidity, wind_speed,
+        cloud_cover, room_temp, target_temp, hour_of_day, day_of_week, month,
+        building_mass.
+        """
         try:
-            if model_name not in self.models:
-                return None
+            model = self.models.get(model_name)
+            
+            if self.online_learning:
+                if model is None or self._online_samples[model_name] < 10:
+                    return None
+                return np.array([
+                    model.predict_one(dict(zip(FEATURE_COLUMNS, row))) for row in features.tolist()
+                ], dtype=np.float64)
             
             # Check if model is trained
-            if not hasattr(self.models[model_name], 'n_features_in_'):
+            if model is None or not hasattr(model, 'n_features_in_'):
                 return None
             
-            # Prepare features
-            features = np.array([[
-                conditions.get('outside_temp', 0),
-                conditions.get('humidity', 50),
-                conditions.get('wind_speed', 0),
-                conditions.get('cloud_cover', 0),
-                conditions.get('room_temp', 20),
-                conditions.get('target_temp', 21),
-                conditions.get('hour_of_day', 12),
-                conditions.get('day_of_week', 0),
-                conditions.get('month', 1),
-                conditions.get('building_mass', 2.0)
-            ]])
-            
-            # Scale features
-            features_scaled = self.scalers[model_name].transform(features)
-            
-            # Make prediction
-            prediction = self.models[model_name].predict(features_scaled)[0]
-            
-            return float(prediction)
+            return self._predict_forest(model_name, model, _scale(self.scalers[model_name], features))
             
         except Exception as e:
-            self.logger.error(f"Error making prediction with {model_name}: {e}")
+            self.logger.error(f"Error making batch prediction with {model_name}: {e}")
             return None
     
+    def _predict_forest(self, model_name: str, model: RandomForestRegressor,
+                        features: np.ndarray) -> np.ndarray:
+        """Predict with a fitted forest, through the compiled kernel when numba is available"""
+        if not HAS_NUMBA:
+            return _forest_predict(model, features)
+        
+        # Refitting replaces or extends the estimators list
+        cached = self._flat_forests.get(model_name)
+        if cached is None or cached[0] is not model.estimators_ or cached[1] != len(model.estimators_):
+            cached = (model.estimators_, len(model.estimators_), _flatten_forest(model))
+            self._flat_forests[model_name] = cached
+        
+        return _flat_forest_predict(np.ascontiguousarray(features, dtype=np.float32), *cached[2])
+    
+    def _make_prediction(self, model_name: str, conditions: Dict[str, Any]) -> Optional[float]:
+        """Make prediction using specified model"""
+        prediction = self._make_batch_prediction(model_name, _feature_rows((conditions,)))
+        return None if prediction is None else float(prediction[0])
+    
     def calculate_thermal_lag(self, building_mass: str, heating_system: str) -> float:
         """Calculate thermal lag based on building characteristics"""
         
@@ -267,7 +984,7 @@ class LearningEngine:
         
         # Learn from historical data if available
         if len(self.historical_data) > 50:
-            learned_factor = self._calculate_learned_thermal_lag()
+            learned_factor = self._cached_analysis('learned_thermal_lag', self._calculate_learned_thermal_lag)
             total_lag = base_lag * mass_factor * system_factor * learned_factor
         else:
             total_lag = base_lag * mass_factor * system_factor
@@ -278,17 +995,11 @@ class LearningEngine:
         """Calculate learned thermal lag factor from historical data"""
         try:
             # Analyze temperature response patterns
-            df = pd.DataFrame(self.historical_data)
-            
-            if len(df) < 20:
+            if len(self.historical_data) < 20:
                 return 1.0
             
-            # Calculate correlation between target temp changes and actual response
-            df['temp_change'] = df['target_temp'].diff()
-            df['room_temp_change'] = df['room_temp'].diff()
-            
-            # Simple correlation analysis
-            correlation = df['temp_change'].corr(df['room_temp_change'])
+            # Correlation between target temp changes and actual response
+            correlation = self.historical_data.statistics.step_correlation()
             
             # Convert correlation to lag factor
             if correlation > 0.7:
@@ -339,15 +1050,13 @@ class LearningEngine:
             return recommendations
         
         try:
-            df = pd.DataFrame(self.historical_data)
-            
             # Analyze thermal response
-            if 'room_temp' in df.columns and 'target_temp' in df.columns:
-                temp_responsiveness = self._analyze_temperature_responsiveness(df)
-                recommendations['thermal_lag_adjustment'] = temp_responsiveness
+            temp_responsiveness = self._cached_analysis('temperature_responsiveness',
+                                                        self._analyze_temperature_responsiveness)
+            recommendations['thermal_lag_adjustment'] = temp_responsiveness
             
             # Analyze weather impact
-            weather_impact = self._analyze_weather_impact(df)
+            weather_impact = self._cached_analysis('weather_impact', self._analyze_weather_impact)
             recommendations.update(weather_impact)
             
         except Exception as e:
@@ -355,21 +1064,26 @@ class LearningEngine:
         
         return recommendations
     
-    def _analyze_temperature_responsiveness(self, df: pd.DataFrame) -> float:
+    def _cached_analysis(self, name: str, analyze: Callable[[], Any]) -> Any:
+        """Result of an analysis of the samples, only recomputed after they changed"""
+        generation = self.historical_data.generation
+        cached = self._analysis_cache.get(name)
+        if cached is None or cached[0] != generation:
+            cached = (generation, analyze())
+            self._analysis_cache[name] = cached
+        return cached[1]
+    
+    def _analyze_temperature_responsiveness(self) -> float:
         """Analyze how responsive the system is to temperature changes"""
         try:
-            # Calculate response time to target temperature changes
-            df['target_change'] = df['target_temp'].diff().abs()
-            df['room_change'] = df['room_temp'].diff().abs()
-            
-            # Look at significant temperature changes (>0.5°C)
-            significant_changes = df[df['target_change'] > 0.5]
+            # Average room response to significant target changes (>0.5°C)
+            significant, response_ratio = self.historical_data.statistics.response()
             
-            if len(significant_changes) < 5:
+            if significant < 5:
                 return 1.0
             
-            # Calculate average response ratio
-            response_ratio = significant_changes['room_change'].mean() / significant_changes['target_change'].mean()
+            if np.isnan(response_ratio):
+                return 1.3  # No measured response at all
             
             # Convert to adjustment factor
             if response_ratio > 0.8:
@@ -383,7 +1097,7 @@ class LearningEngine:
             self.logger.error(f"Error analyzing temperature responsiveness: {e}")
             return 1.0
     
-    def _analyze_weather_impact(self, df: pd.DataFrame) -> Dict[str, float]:
+    def _analyze_weather_impact(self) -> Dict[str, float]:
         """Analyze impact of weather on energy consumption"""
         impact = {
             'solar_gain_adjustment': 1.0,
@@ -391,24 +1105,23 @@ class LearningEngine:
         }
         
         try:
-            if len(df) < 30:
+            if len(self.historical_data) < 30:
                 return impact
             
             # Analyze correlation between weather and energy consumption
-            if 'energy_consumption' in df.columns:
-                # Solar impact analysis
-                if 'cloud_cover' in df.columns:
-                    solar_corr = df['cloud_cover'].corr(df['energy_consumption'])
-                    if abs(solar_corr) > 0.3:
-                        # Strong correlation - adjust solar gain factor
-                        impact['solar_gain_adjustment'] = 1.0 + (solar_corr * 0.5)
-                
-                # Wind impact analysis
-                if 'wind_speed' in df.columns:
-                    wind_corr = df['wind_speed'].corr(df['energy_consumption'])
-                    if abs(wind_corr) > 0.3:
-                        # Strong correlation - adjust wind factor
-                        impact['wind_factor_adjustment'] = 1.0 + (wind_corr * 0.3)
+            statistics = self.historical_data.statistics
+            
+            # Solar impact analysis
+            solar_corr = statistics.correlation('cloud_energy')
+            if abs(solar_corr) > 0.3:
+                # Strong correlation - adjust solar gain factor
+                impact['solar_gain_adjustment'] = 1.0 + (solar_corr * 0.5)
+            
+            # Wind impact analysis
+            wind_corr = statistics.correlation('wind_energy')
+            if abs(wind_corr) > 0.3:
+                # Strong correlation - adjust wind factor
+                impact['wind_factor_adjustment'] = 1.0 + (wind_corr * 0.3)
             
         except Exception as e:
             self.logger.error(f"Error analyzing weather impact: {e}")
@@ -416,14 +1129,15 @@ class LearningEngine:
         return impact
     
     async def save_data(self):
-        """Save learning data to file"""
+        """Save learning data to file
+        
+        Samples are written column-wise to a NumPy archive next to the JSON
+        file, which only keeps the model metadata. The sample log is emptied as
+        its samples are now part of the archive.
+        """
         try:
-            # Ensure data directory exists
-            self.data_path.parent.mkdir(parents=True, exist_ok=True)
-            
             # Save data
             save_data = {
-                'historical_data': self.historical_data,
                 'model_accuracy': self.model_accuracy,
                 'config_snapshot': {
                     'learning_rate': self.learning_rate,
@@ -434,33 +1148,187 @@ class LearningEngine:
                 'saved_at': datetime.now().isoformat()
             }
             
-            with open(self.data_path, 'w') as f:
-                json.dump(save_data, f, indent=2)
+            # Snapshot on the event loop (column views are immutable), write in the I/O pool
+            payload = dumps_bytes(save_data)
+            columns = self.historical_data.columns()
+            await asyncio.get_running_loop().run_in_executor(
+                self._io_executor, self._write_data_file, payload, columns
+            )
+            
+            self._last_compaction = time.monotonic()
             
             self.logger.debug(f"Saved learning data to {self.data_path}")
             
         except Exception as e:
             self.logger.error(f"Error saving learning data: {e}")
     
+    async def close(self):
+        """Stop the background work, call after the final save_data
+        
+        A retrain waiting for its thread is cancelled. A fit already running
+        cannot be interrupted and still finishes before the interpreter exits.
+        Queued file writes are completed.
+        """
+        if self._retrain_future is not None and not self._retrain_future.done():
+            self._retrain_future.cancel()
+            await asyncio.gather(self._retrain_future, return_exceptions=True)
+        self._retrain_future = None
+        
+        self._retrain_executor.shutdown(wait=False, cancel_futures=True)
+        self._io_executor.shutdown(wait=False)
+    
+    @property
+    def samples_path(self) -> Path:
+        """NumPy archive holding the sample columns"""
+        return self.data_path.with_suffix('.npz')
+    
+    def _write_data_file(self, payload: bytes, columns: Dict[str, np.ndarray]):
+        """Compact the sample log into the archive (blocking)
+        
+        Runs in the writer thread after the log appends queued before the
+        snapshot, so the log set aside first holds no samples newer than it.
+        Both files are replaced atomically and the set-aside log is only removed
+        once they are in place; samples it shares with the archive after a
+        crash are skipped on load.
+        """
+        # Ensure data directory exists
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        if self.samples_log_path.exists():
+            if self.samples_compacting_path.exists():
+                # Left over from an interrupted compaction, keep both logs' samples
+                with open(self.samples_compacting_path, 'ab') as f:
+                    f.write(self.samples_log_path.read_bytes())
+                    _sync(f)
+                self.samples_log_path.unlink()
+            else:
+                os.replace(self.samples_log_path, self.samples_compacting_path)
+        
+        samples_tmp = _write_temporary(self.samples_path, lambda f: np.savez(f, **columns))
+        data_tmp = _write_temporary(self.data_path, lambda f: f.write(payload))
+        os.replace(samples_tmp, self.samples_path)
+        os.replace(data_tmp, self.data_path)
+        
+        self.samples_compacting_path.unlink(missing_ok=True)
+    
+    @property
+    def samples_log_path(self) -> Path:
+        """Newline-delimited JSON log of samples added since the last save"""
+        return self.data_path.with_suffix('.ndjson')
+    
+    @property
+    def samples_compacting_path(self) -> Path:
+        """Sample log set aside while it is compacted into the archive"""
+        return self.data_path.with_suffix('.ndjson.compacting')
+    
+    async def _append_samples(self, data_points: List[Dict[str, Any]]):
+        """Append new samples to the sample log"""
+        payload = b''.join(dumps_bytes(dp) + b'\n' for dp in data_points)
+        await asyncio.get_running_loop().run_in_executor(
+            self._io_executor, self._append_log_file, payload
+        )
+    
+    def _append_log_file(self, payload: bytes):
+        """Append serialized samples to the sample log (blocking)"""
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        with open(self.samples_log_path, 'ab') as f:
+            f.write(payload)
+    
+    @staticmethod
+    def _parse_timestamp(timestamp: Union[float, str]) -> float:
+        """Convert a persisted ISO timestamp back to a POSIX timestamp"""
+        if isinstance(timestamp, str):
+            return datetime.fromisoformat(timestamp).timestamp()
+        return timestamp
+    
+    def _quarantine(self, path: Path, error: Exception):
+        """Move an unreadable data file aside so the next save cannot overwrite it"""
+        target = path.with_name(f"{path.name}.corrupt-{int(time.time())}")
+        self.logger.error(f"Unreadable learning data {path}, moved to {target}: {error}")
+        try:
+            os.replace(path, target)
+        except OSError as e:
+            self.logger.error(f"Could not move {path} aside: {e}")
+    
     def _load_data(self):
-        """Load learning data from file"""
+        """Load learning data from file
+        
+        Unreadable data files are moved aside and the samples logs are still
+        replayed, so startup continues with whatever could be loaded.
+        """
+        data = {}
+        if self.data_path.exists():
+            try:
+                with open(self.data_path, 'rb') as f:
+                    data = loads(f.read())
+            except Exception as e:
+                self._quarantine(self.data_path, e)
+        
+        self.historical_data = SampleStore()
+        if self.samples_path.exists():
+            try:
+                with np.load(self.samples_path) as archive:
+                    self.historical_data = SampleStore.from_columns(archive)
+            except Exception as e:
+                self._quarantine(self.samples_path, e)
+        else:
+            # Files written before samples were stored column-wise
+            try:
+                rows = data.get('historical_data', [])
+                for dp in rows:
+                    dp['timestamp'] = self._parse_timestamp(dp['timestamp'])
+                self.historical_data = SampleStore(rows)
+            except Exception as e:
+                self._quarantine(self.data_path, e)
+                data = {}
+        
+        # Samples added after the last save, a log set aside by an interrupted
+        # compaction first; samples already stored are skipped by timestamp
+        store = self.historical_data
+        latest = store.column('timestamp')[-1] if len(store) else -np.inf
+        rows = []
+        for path in (self.samples_compacting_path, self.samples_log_path):
+            if path.exists():
+                try:
+                    for row in self._read_log_file(path):
+                        if row['timestamp'] > latest:
+                            rows.append(row)
+                            latest = row['timestamp']
+                except OSError as e:
+                    self.logger.error(f"Could not read samples log {path}: {e}")
+        store.extend(rows)
+        
         try:
-            if self.data_path.exists():
-                with open(self.data_path, 'r') as f:
-                    data = json.load(f)
-                
-                self.historical_data = data.get('historical_data', [])
+            if data or len(self.historical_data):
+                if len(self.historical_data):
+                    self._update_feature_stats(np.column_stack(
+                        [self.historical_data.column(name) for name in FEATURE_COLUMNS]
+                    ))
                 self.model_accuracy = data.get('model_accuracy', {})
                 
                 self.logger.info(f"Loaded {len(self.historical_data)} historical data points")
                 
-                # Retrain models if we have enough data
-                if len(self.historical_data) >= self.min_samples_for_learning:
+                if self.online_learning:
+                    # Warm up the online models on the most recent samples
+                    size = len(self.historical_data)
+                    self._learn_online(
+                        self.historical_data[i] for i in range(max(0, size - self.incremental_window), size)
+                    )
+                elif len(self.historical_data) >= self.min_samples_for_learning:
                     # Schedule retraining in background
-                    import asyncio
-                    asyncio.create_task(self._retrain_models())
+                    self._schedule_retrain()
             
         except Exception as e:
             self.logger.error(f"Error loading learning data: {e}")
-            self.historical_data = []
-            self.model_accuracy = {}
\ No newline at end of file
+    
+    def _read_log_file(self, path: Path) -> List[Dict[str, Any]]:
+        """Read a sample log, skipping lines cut short by an interrupted write"""
+        rows = []
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    rows.append(loads(line))
+                except ValueError:
+                    self.logger.warning("Skipping unreadable line in sample log")
+        return rows
\ No newline at end of file
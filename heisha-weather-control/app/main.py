@@ -8,16 +8,28 @@ import asyncio
 import json
 import logging
 import os
+import signal
 import sys
-from datetime import datetime, timedelta
-from typing import Dict, Any
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
 
 from heisha_controller import HeishaController
-from weather_service import WeatherService
+from weather_service import Forecast, WeatherService
+from http_client import close_shared_session, get_shared_session
 from predictive_algorithm import PredictiveAlgorithm
 from learning_engine import LearningEngine
 from mqtt_client import MQTTClient
-from config_manager import ConfigManager
+from config_manager import AppConfig, ConfigManager
+
+# Control loop timing (seconds)
+CONTROL_INTERVAL = 300      # Safety timeout - run at least this often
+CONTROL_MIN_INTERVAL = 60   # Debounce - never run more often than this
+LEARNING_FLUSH_PASSES = 12  # Control passes buffered before the learning update
+ERROR_BACKOFF_MIN = 60      # First retry delay after an error
+ERROR_BACKOFF_MAX = 600     # Upper bound for the exponential retry delay
+IO_WORKERS = 2              # Threads for blocking file I/O
 
 # Setup logging
 def setup_logging(log_level: str = "INFO") -> None:
@@ -41,6 +53,7 @@ class HeishaWeatherControl:
         self.logger = logging.getLogger(__name__)
         self.config_manager = ConfigManager()
         self.config = self.config_manager.load_config()
+        self.settings = AppConfig.from_dict(self.config)
         
         # Initialize components
         self.mqtt_client = None
@@ -51,27 +64,45 @@ class HeishaWeatherControl:
         
         self.running = False
         
+        # Event-driven control loop state
+        self._loop = None
+        self._tick = asyncio.Event()
+        self._last_input_signature = None
+        self._last_settings_signature = None
+        
+        # Observations buffered for the next learning update
+        self._pending_observations = deque(maxlen=2048)
+        
     async def initialize(self) -> bool:
         """Initialize all components"""
         try:
             self.logger.info("Initializing Heisha Weather Prediction Control...")
             
+            # Pick up option changes made since construction (cached if unchanged)
+            self.config = await self.config_manager.load_config_async()
+            self.settings = AppConfig.from_dict(self.config)
+            
+            mqtt_config = self.settings.mqtt
+            weather_config = self.settings.weather
+            house_config = self.settings.house
+            
             # Initialize MQTT client
             self.mqtt_client = MQTTClient(
-                broker=self.config['mqtt']['broker'],
-                port=self.config['mqtt']['port'],
-                username=self.config['mqtt'].get('username'),
-                password=self.config['mqtt'].get('password'),
-                topic_prefix=self.config['mqtt']['topic_prefix']
+                broker=mqtt_config.broker,
+                port=mqtt_config.port,
+                username=mqtt_config.username,
+                password=mqtt_config.password,
+                topic_prefix=mqtt_config.topic_prefix
             )
             
-            # Initialize weather service
+            # Initialize weather service on the application-wide HTTP session
             self.weather_service = WeatherService(
-                provider=self.config['weather']['api_provider'],
-                api_key=self.config['weather']['api_key'],
-                latitude=self.config['house']['latitude'],
-                longitude=self.config['house']['longitude'],
-                update_interval=self.config['weather']['update_interval']
+                provider=weather_config.api_provider,
+                api_key=weather_config.api_key,
+                latitude=house_config.latitude,
+                longitude=house_config.longitude,
+                update_interval=weather_config.update_interval,
+                session=get_shared_session()
             )
             
             # Initialize Heisha controller
@@ -91,18 +122,38 @@ class HeishaWeatherControl:
                 config=self.config,
                 learning_engine=self.learning_engine
             )
+            self.predictive_algorithm.warmup()
             
             # Connect MQTT
             await self.mqtt_client.connect()
             self.logger.info("MQTT connected successfully")
             
-            # Initialize weather service
-            await self.weather_service.initialize()
-            self.logger.info("Weather service initialized")
+            # Weather service and Heisha controller are independent of each
+            # other once MQTT is up - initialize them concurrently
+            components = ("Weather service", "Heisha controller")
+            results = await asyncio.gather(
+                self.weather_service.initialize(),
+                self.heisha_controller.initialize(),
+                return_exceptions=True
+            )
             
-            # Initialize Heisha controller
-            await self.heisha_controller.initialize()
-            self.logger.info("Heisha controller initialized")
+            failed = False
+            for name, result in zip(components, results):
+                if isinstance(result, Exception):
+                    self.logger.error(f"{name} initialization failed: {result}")
+                    failed = True
+                elif not result:
+                    self.logger.warning(f"{name} initialization reported a problem")
+                else:
+                    self.logger.info(f"{name} initialized")
+            
+            if failed:
+                return False
+            
+            # Wake the control loop whenever new input data arrives
+            self._loop = asyncio.get_running_loop()
+            self.weather_service.register_update_callback(self._on_new_data)
+            self.heisha_controller.register_update_callback(self._on_new_data)
             
             self.logger.info("All components initialized successfully")
             return True
@@ -111,68 +162,159 @@ class HeishaWeatherControl:
             self.logger.error(f"Failed to initialize components: {e}")
             return False
     
+    def _on_new_data(self):
+        """Wake up the control loop (safe to call from any thread)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._tick.set)
+    
+    async def _wait_for_new_data(self, last_run: float):
+        """Wait until new input data arrived or the safety timeout elapsed"""
+        try:
+            await asyncio.wait_for(self._tick.wait(), timeout=CONTROL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        
+        # Debounce bursts of MQTT updates into a single control pass
+        remaining = CONTROL_MIN_INTERVAL - (self._loop.time() - last_run)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        
+        self._tick.clear()
+    
+    def _input_signature(self, current_status: Dict[str, Any],
+                         weather_forecast: Forecast,
+                         now: float) -> int:
+        """Hash the inputs relevant for a prediction"""
+        temperatures = current_status.get('temperatures', {})
+        
+        return hash((
+            time.localtime(now).tm_hour,  # Comfort targets depend on the time of day
+            tuple(temperatures.get(key) for key in ('room', 'target', 'outside', 'outlet')),
+            weather_forecast.epochs.tobytes(),
+            *(weather_forecast.column(key).tobytes()
+              for key in ('temperature', 'humidity', 'wind_speed', 'clouds'))
+        ))
+    
     async def run_control_loop(self):
-        """Main control loop"""
+        """Main control loop
+        
+        Runs whenever the weather service or the heat pump deliver new data,
+        but at least every CONTROL_INTERVAL seconds. Predictions are skipped
+        if none of the relevant inputs changed since the last pass.
+        """
         self.logger.info("Starting predictive control loop")
         
+        # Components do not change while the loop runs
+        heisha_controller = self.heisha_controller
+        weather_service = self.weather_service
+        predictive_algorithm = self.predictive_algorithm
+        pending = self._pending_observations
+        logger = self.logger
+        backoff = ERROR_BACKOFF_MIN
+        
         while self.running:
+            last_run = self._loop.time()
+            now = time.time()
+            
             try:
                 # Get current status from heat pump
-                current_status = await self.heisha_controller.get_status()
+                current_status = await heisha_controller.get_status()
                 
                 # Get weather forecast
-                weather_forecast = await self.weather_service.get_forecast()
+                weather_forecast = await weather_service.get_forecast()
                 
-                # Run predictive algorithm
-                prediction = await self.predictive_algorithm.predict(
-                    current_status=current_status,
-                    weather_forecast=weather_forecast
-                )
+                signature = self._input_signature(current_status, weather_forecast, now)
                 
-                # Apply control decisions
-                if prediction['action_needed']:
-                    await self.heisha_controller.apply_settings(prediction['settings'])
-                    self.logger.info(f"Applied new settings: {prediction['settings']}")
+                if signature != self._last_input_signature:
+                    # Run predictive algorithm
+                    prediction = await predictive_algorithm.predict(
+                        current_status=current_status,
+                        weather_forecast=weather_forecast
+                    )
+                    
+                    # Apply control decisions
+                    if prediction['action_needed']:
+                        settings = prediction['settings']
+                        settings_signature = hash(tuple(sorted(settings.items())))
+                        
+                        # Skip redundant MQTT publishes of unchanged settings
+                        if settings_signature != self._last_settings_signature:
+                            await heisha_controller.apply_settings(settings)
+                            logger.info("Applied new settings: %s", settings)
+                            self._last_settings_signature = settings_signature
+                        else:
+                            logger.debug("Settings unchanged - skipping apply")
+                    
+                    # Buffer results and update the learning engine in batches
+                    pending.append((current_status, weather_forecast, prediction, now))
+                    if len(pending) >= LEARNING_FLUSH_PASSES:
+                        await self._flush_observations()
+                    
+                    self._last_input_signature = signature
+                else:
+                    logger.debug("Inputs unchanged - skipping prediction")
                 
-                # Update learning engine with results
-                await self.learning_engine.update_data(
-                    current_status=current_status,
-                    weather_data=weather_forecast,
-                    prediction=prediction,
-                    timestamp=datetime.now()
-                )
+                backoff = ERROR_BACKOFF_MIN
                 
-                # Sleep for next iteration (default: 5 minutes)
-                await asyncio.sleep(300)
+                # Wait for new data (at most CONTROL_INTERVAL seconds)
+                await self._wait_for_new_data(last_run)
                 
             except Exception as e:
-                self.logger.error(f"Error in control loop: {e}")
-                await asyncio.sleep(60)  # Wait 1 minute before retry
+                logger.error("Error in control loop: %s - retrying in %ds", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, ERROR_BACKOFF_MAX)
+    
+    async def _flush_observations(self):
+        """Hand buffered observations to the learning engine"""
+        if self._pending_observations:
+            observations = list(self._pending_observations)
+            self._pending_observations.clear()
+            await self.learning_engine.bulk_update(observations)
     
     async def start(self):
         """Start the application"""
         self.running = True
         
+        # Small bounded pool for blocking I/O offloaded with run_in_executor(None, ...)
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="heisha-io")
+        )
+        
         if not await self.initialize():
             self.logger.error("Failed to initialize application")
             return
         
         self.logger.info("Heisha Weather Prediction Control started successfully")
         
-        # Start background tasks
-        tasks = [
-            asyncio.create_task(self.run_control_loop()),
-            asyncio.create_task(self.weather_service.start_updates()),
-            asyncio.create_task(self.heisha_controller.monitor_status())
-        ]
+        # The Supervisor stops add-ons with SIGTERM
+        loop = asyncio.get_running_loop()
+        shutdown_event = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, shutdown_event.set)
         
+        # Start background tasks - a failing task cancels its siblings
         try:
-            await asyncio.gather(*tasks)
-        except KeyboardInterrupt:
-            self.logger.info("Received shutdown signal")
+            async with asyncio.TaskGroup() as tg:
+                tasks = [
+                    tg.create_task(self.run_control_loop()),
+                    tg.create_task(self.weather_service.start_updates()),
+                    tg.create_task(self.heisha_controller.monitor_status())
+                ]
+                tg.create_task(self._shutdown_on(shutdown_event, tasks))
         finally:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(sig)
             await self.stop()
     
+    async def _shutdown_on(self, shutdown_event: asyncio.Event, tasks: List[asyncio.Task]):
+        """Cancel the background tasks once a shutdown signal was received"""
+        await shutdown_event.wait()
+        self.logger.info("Received shutdown signal")
+        self.running = False
+        
+        for task in tasks:
+            task.cancel()
+    
     async def stop(self):
         """Stop the application"""
         self.logger.info("Shutting down Heisha Weather Prediction Control...")
@@ -184,8 +326,12 @@ class HeishaWeatherControl:
         if self.weather_service:
             await self.weather_service.stop()
         
+        await close_shared_session()
+        
         if self.learning_engine:
+            await self._flush_observations()
             await self.learning_engine.save_data()
+            await self.learning_engine.close()
         
         self.logger.info("Shutdown complete")
 
@@ -198,6 +344,14 @@ def main():
     logger = logging.getLogger(__name__)
     logger.info("Starting Heisha Weather Prediction Control Add-On")
     
+    # Use the libuv based event loop if available (not on all architectures)
+    try:
+        import uvloop
+        uvloop.install()
+        logger.debug("Using uvloop event loop")
+    except ImportError:
+        pass
+    
     # Create and run application
     app = HeishaWeatherControl()
     
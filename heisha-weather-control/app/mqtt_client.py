@@ -4,13 +4,51 @@ Handles communication with Home Assistant and HeishaMon
 """
 
 import asyncio
-import json
 import logging
+import re
 from datetime import datetime
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple, Union
 
 import paho.mqtt.client as mqtt
 
+from compat import dumps_bytes, loads
+
+# Decimal numbers with optional exponent, the payload of most HeishaMon topics
+_NUMBER_RE = re.compile(rb'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+
+CONNECT_TIMEOUT = 30  # Seconds to wait for the broker's CONNACK
+MAX_RECONNECT_DELAY = 60  # Upper bound of the reconnect backoff in seconds
+
+# Home Assistant sensors read from the aggregate prediction state topic:
+# (prediction key, sensor id, name, unit)
+_PREDICTION_SENSORS = (
+    ('target_temperature', 'prediction_target_temp', 'Heisha Prediction Target Temperature', '°C'),
+    ('predicted_cop', 'prediction_efficiency', 'Heisha Prediction Efficiency', None),
+    ('learning_confidence', 'learning_progress', 'Heisha Learning Progress', None),
+    ('weather_impact', 'weather_influence', 'Heisha Weather Influence', None)
+)
+
+# Weather influence attributes and the prediction keys they are taken from
+_WEATHER_INFLUENCE_ATTRIBUTES = {
+    'outside_temp': 'outside_temp_forecast',
+    'wind_speed': 'wind_speed',
+    'solar_radiation': 'solar_radiation'
+}
+
+
+def _compile_topic_filter(topic_filter: str) -> re.Pattern:
+    """Compile an MQTT topic filter with + and # wildcards to a regex"""
+    levels = topic_filter.split('/')
+    multi_level = levels[-1] == '#'
+    if multi_level:
+        levels.pop()
+    
+    pattern = '/'.join('[^/]*' if level == '+' else re.escape(level) for level in levels)
+    if multi_level:
+        # '#' also matches the parent level itself
+        pattern = f"{pattern}(?:/.*)?" if levels else '.*'
+    return re.compile(pattern)
+
 
 class MQTTClient:
     """MQTT client for communication with HeishaMon and Home Assistant"""
@@ -28,9 +66,29 @@ class MQTTClient:
         self.connected = False
         self.message_callbacks = {}
         
+        # paho's network loop runs on the asyncio event loop: the socket is
+        # watched with add_reader/add_writer, keepalive runs in _misc_task.
+        # Connecting resolves and opens the socket in an executor thread, so the
+        # socket callbacks hand their work to the loop with call_soon_threadsafe
+        self._loop = None
+        self._misc_task = None
+        self._connack = None
+        
+        # Dispatch tables built from message_callbacks: exact topics are looked
+        # up directly, wildcard filters are matched with precompiled regexes
+        self._exact_callbacks = {}
+        self._wildcard_callbacks = []
+        
         # Home Assistant discovery topics
         self.ha_discovery_prefix = "homeassistant"
         
+        # State topics published repeatedly
+        self._prediction_state_topic = f"{topic_prefix}/prediction/state"
+        self._sensor_state_topics = {}
+        
+        # Discovery payloads only depend on the topic prefix, serialize them once
+        self._discovery_messages = self._build_discovery_messages()
+        
     async def connect(self) -> bool:
         """Connect to MQTT broker"""
         try:
@@ -44,23 +102,28 @@ class MQTTClient:
             self.client.on_connect = self._on_connect
             self.client.on_disconnect = self._on_disconnect
             self.client.on_message = self._on_message
+            self.client.on_socket_open = self._on_socket_open
+            self.client.on_socket_close = self._on_socket_close
+            self.client.on_socket_register_write = self._on_socket_register_write
+            self.client.on_socket_unregister_write = self._on_socket_unregister_write
+            
+            self._loop = asyncio.get_running_loop()
+            self._connack = self._loop.create_future()
             
             # Connect to broker
             self.logger.info(f"Connecting to MQTT broker {self.broker}:{self.port}")
-            self.client.connect(self.broker, self.port, 60)
-            
-            # Start loop in background
-            self.client.loop_start()
+            await self._loop.run_in_executor(None, self.client.connect, self.broker, self.port, 60)
+            self._misc_task = asyncio.create_task(self._misc_loop())
             
             # Wait for connection
-            for _ in range(30):  # Wait up to 30 seconds
-                if self.connected:
-                    break
-                await asyncio.sleep(1)
-            
-            if not self.connected:
+            try:
+                rc = await asyncio.wait_for(self._connack, timeout=CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
                 raise ConnectionError("Failed to connect to MQTT broker within timeout")
             
+            if rc != 0:
+                raise ConnectionError(f"MQTT broker refused the connection, return code {rc}")
+            
             # Subscribe to HeishaMon topics
             await self._subscribe_to_heishamon()
             
@@ -75,13 +138,54 @@ class MQTTClient:
     
     async def disconnect(self):
         """Disconnect from MQTT broker"""
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+        
         if self.client:
-            self.client.loop_stop()
             self.client.disconnect()
             self.connected = False
     
+    async def _misc_loop(self):
+        """Handle keepalive pings and reconnect with backoff after a lost connection"""
+        delay = 1
+        while True:
+            await asyncio.sleep(delay)
+            
+            if self.client.loop_misc() != mqtt.MQTT_ERR_NO_CONN:
+                delay = 1
+                continue
+            
+            try:
+                self.logger.info("Reconnecting to MQTT broker")
+                await self._loop.run_in_executor(None, self.client.reconnect)
+                delay = 1
+            except Exception as e:
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                self.logger.warning("MQTT reconnect failed: %s - retrying in %ss", e, delay)
+    
+    def _on_socket_open(self, client, userdata, sock):
+        """Read from the broker socket on the event loop"""
+        self._loop.call_soon_threadsafe(self._loop.add_reader, sock, client.loop_read)
+    
+    def _on_socket_close(self, client, userdata, sock):
+        """Stop watching a closed broker socket"""
+        self._loop.call_soon_threadsafe(self._loop.remove_reader, sock)
+        self._loop.call_soon_threadsafe(self._loop.remove_writer, sock)
+    
+    def _on_socket_register_write(self, client, userdata, sock):
+        """Flush outgoing packets when the socket becomes writable"""
+        self._loop.call_soon_threadsafe(self._loop.add_writer, sock, client.loop_write)
+    
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        """All outgoing packets were written"""
+        self._loop.call_soon_threadsafe(self._loop.remove_writer, sock)
+    
     def _on_connect(self, client, userdata, flags, rc):
         """Callback for MQTT connection"""
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_result(rc)
+        
         if rc == 0:
             self.connected = True
             self.logger.info("Connected to MQTT broker successfully")
@@ -100,17 +204,30 @@ class MQTTClient:
         """Callback for MQTT messages"""
         try:
             topic = msg.topic
-            payload = msg.payload.decode('utf-8')
+            payload = msg.payload
             
-            # Handle JSON payloads
-            try:
-                data = json.loads(payload)
-            except json.JSONDecodeError:
-                data = payload
+            # Numbers are converted straight from the bytes (surrounding
+            # whitespace allowed, as JSON does), only objects and arrays are
+            # parsed as JSON, anything else is passed on as text
+            data = None
+            value = payload.strip()
+            if _NUMBER_RE.fullmatch(value):
+                data = int(value) if value.lstrip(b'-').isdigit() else float(value)
+            elif value[:1] in (b'{', b'['):
+                try:
+                    data = loads(value)
+                except ValueError:
+                    pass
+            if data is None:
+                data = payload.decode('utf-8', 'replace')
             
             # Call registered callbacks
-            for pattern, callback in self.message_callbacks.items():
-                if pattern in topic:
+            callback = self._exact_callbacks.get(topic)
+            if callback is not None:
+                callback(topic, data)
+            
+            for regex, callback in self._wildcard_callbacks:
+                if regex.fullmatch(topic):
                     callback(topic, data)
                     
         except Exception as e:
@@ -128,8 +245,8 @@ class MQTTClient:
             self.client.subscribe(topic)
             self.logger.debug(f"Subscribed to topic: {topic}")
     
-    async def _publish_ha_discovery(self):
-        """Publish Home Assistant discovery messages"""
+    def _build_discovery_messages(self) -> List[Tuple[str, bytes]]:
+        """Build the (topic, payload) Home Assistant discovery messages"""
         device_info = {
             "identifiers": ["heisha_weather_control"],
             "name": "Heisha Weather Control",
@@ -155,11 +272,9 @@ class MQTTClient:
             "temperature_unit": "C"
         }
         
-        await self.publish(
-            f"{self.ha_discovery_prefix}/climate/heisha/config",
-            json.dumps(climate_config),
-            retain=True
-        )
+        messages = [
+            (f"{self.ha_discovery_prefix}/climate/heisha/config", dumps_bytes(climate_config))
+        ]
         
         # Temperature sensors
         sensors = [
@@ -193,17 +308,39 @@ class MQTTClient:
             }
         ]
         
+        # Prediction sensors, all fed by one JSON state message
+        for key, unique_id, name, unit in _PREDICTION_SENSORS:
+            sensor = {
+                "name": name,
+                "unique_id": f"heisha_{unique_id}",
+                "state_topic": self._prediction_state_topic,
+                "value_template": f"{{{{ value_json.{key} }}}}"
+            }
+            if unit:
+                sensor["unit_of_measurement"] = unit
+            sensors.append(sensor)
+        
+        # Weather influence (added last) carries the forecast details as attributes
+        sensors[-1]["json_attributes_topic"] = self._prediction_state_topic
+        sensors[-1]["json_attributes_template"] = "{{ value_json.weather_influence | tojson }}"
+        
         for sensor in sensors:
             sensor["device"] = device_info
-            await self.publish(
+            messages.append((
                 f"{self.ha_discovery_prefix}/sensor/heisha/{sensor['unique_id']}/config",
-                json.dumps(sensor),
-                retain=True
-            )
+                dumps_bytes(sensor)
+            ))
+        
+        return messages
+    
+    async def _publish_ha_discovery(self):
+        """Publish Home Assistant discovery messages"""
+        for topic, payload in self._discovery_messages:
+            await self.publish(topic, payload, retain=True)
         
         self.logger.info("Published Home Assistant discovery messages")
     
-    async def publish(self, topic: str, payload: str, retain: bool = False):
+    async def publish(self, topic: str, payload: Union[str, bytes], retain: bool = False):
         """Publish message to MQTT topic"""
         if not self.connected:
             self.logger.warning("Cannot publish - MQTT not connected")
@@ -216,8 +353,17 @@ class MQTTClient:
             self.logger.error(f"Failed to publish to {topic}: {e}")
     
     def subscribe_to_topic(self, topic: str, callback: Callable):
-        """Subscribe to a topic with callback"""
+        """Subscribe to a topic filter (may contain + and # wildcards) with callback"""
         self.message_callbacks[topic] = callback
+        
+        self._exact_callbacks = {}
+        self._wildcard_callbacks = []
+        for topic_filter, handler in self.message_callbacks.items():
+            if '+' in topic_filter or '#' in topic_filter:
+                self._wildcard_callbacks.append((_compile_topic_filter(topic_filter), handler))
+            else:
+                self._exact_callbacks[topic_filter] = handler
+        
         if self.connected:
             self.client.subscribe(topic)
     
@@ -229,10 +375,12 @@ class MQTTClient:
     
     async def update_ha_sensor(self, sensor_name: str, value: Any, unit: str = None):
         """Update Home Assistant sensor value"""
-        topic = f"{self.topic_prefix}/sensor/{sensor_name}/state"
+        topic = self._sensor_state_topics.get(sensor_name)
+        if topic is None:
+            topic = self._sensor_state_topics[sensor_name] = f"{self.topic_prefix}/sensor/{sensor_name}/state"
         
         if isinstance(value, dict):
-            payload = json.dumps(value)
+            payload = dumps_bytes(value)
         else:
             payload = str(value)
         
@@ -240,33 +388,26 @@ class MQTTClient:
         
         # Also publish attributes if it's a dict
         if isinstance(value, dict) and 'value' in value:
-            await self.publish(f"{topic}/attributes", json.dumps({
+            await self.publish(f"{topic}/attributes", dumps_bytes({
                 k: v for k, v in value.items() if k != 'value'
             }))
     
-    async def publish_prediction_data(self, prediction_data: Dict[str, Any]):
-        """Publish prediction data to Home Assistant"""
+    async def publish_prediction_state(self, prediction_data: Dict[str, Any]):
+        """Publish prediction data to Home Assistant as one retained JSON message
         
-        # Current prediction
-        await self.update_ha_sensor("prediction_target_temp", 
-                                  prediction_data.get('target_temperature', 0))
-        
-        # Efficiency metrics
-        await self.update_ha_sensor("prediction_efficiency", 
-                                  prediction_data.get('predicted_cop', 0))
-        
-        # Learning progress
-        await self.update_ha_sensor("learning_progress", 
-                                  prediction_data.get('learning_confidence', 0))
-        
-        # Weather influence
-        weather_influence = {
-            'value': prediction_data.get('weather_impact', 0),
-            'outside_temp': prediction_data.get('outside_temp_forecast', 0),
-            'wind_speed': prediction_data.get('wind_speed', 0),
-            'solar_radiation': prediction_data.get('solar_radiation', 0)
+        The prediction sensors announced in the discovery messages take their
+        values from this message with value templates.
+        """
+        state = {key: prediction_data.get(key, 0) for key, *_ in _PREDICTION_SENSORS}
+        state['weather_influence'] = {
+            attribute: prediction_data.get(key, 0)
+            for attribute, key in _WEATHER_INFLUENCE_ATTRIBUTES.items()
         }
         
-        await self.update_ha_sensor("weather_influence", weather_influence)
+        await self.publish(self._prediction_state_topic, dumps_bytes(state), retain=True)
         
-        self.logger.debug("Published prediction data to Home Assistant")
\ No newline at end of file
+        self.logger.debug("Published prediction data to Home Assistant")
+    
+    async def publish_prediction_data(self, prediction_data: Dict[str, Any]):
+        """Publish prediction data to Home Assistant"""
+        await self.publish_prediction_state(prediction_data)
@@ -131,7 +131,10 @@ run_tests() {
         pip3 install -r requirements-test.txt
         
         # Run tests
-        python3 -m pytest tests/ -v --cov=app --cov-report=html
+        # Scripted one-shot run: no .pytest_cache, compact progress output,
+        # one test class per xdist worker
+        python3 -m pytest tests/ -v -p no:cacheprovider -o console_output_style=count \
+            -n auto --dist=loadscope --cov=app --cov-report=html
         
         echo -e "${GREEN}Tests passed${NC}"
     else
@@ -0,0 +1,11 @@
+"""
+Shared test setup for Heisha Weather Prediction Control
+"""
+
+import os
+import sys
+
+# Add app directory to path for imports
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app'))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)